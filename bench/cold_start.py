@@ -0,0 +1,79 @@
+"""
+Cold start time: importing loginapp, building the app and serving the first request.
+
+    python bench/cold_start.py --runs 10
+    python bench/cold_start.py --runs 10 --compare HEAD~1
+
+Every run is a fresh interpreter, so nothing is cached between runs. With
+--compare the same measurement is taken in a git worktree of that revision
+(trees from before create_app() are measured through `from loginapp import app`).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the child interpreter, prints one JSON line of timings in seconds
+PROBE = r"""
+import json, os, sys, time
+start = time.perf_counter()
+import loginapp
+imported = time.perf_counter()
+if hasattr(loginapp, 'create_app'):
+    app = loginapp.create_app({'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL']})
+else:
+    app = loginapp.app
+created = time.perf_counter()
+status = app.test_client().get('/').status_code
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created, 'total': served - start,
+                  'status': status, 'modules': len(sys.modules)}))
+"""
+
+
+def measure(tree, runs):
+    samples = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix='pmd-cold-')
+        env = dict(os.environ,
+                   DATABASE_URL='sqlite:///' + os.path.join(workdir, 'cold.db'),
+                   EXT_DB_PATH=os.path.join(workdir, 'ext.db'))
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=tree, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+        shutil.rmtree(workdir, ignore_errors=True)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label}: {samples[0]['modules']} modules loaded, first request status {samples[0]['status']}")
+    for phase in ('import', 'create_app', 'first_request', 'total'):
+        values = [sample[phase] * 1000 for sample in samples]
+        print(f"  {phase:<14} median {statistics.median(values):8.1f} ms  min {min(values):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--compare', help='git revision to measure as the baseline')
+    args = parser.parse_args()
+
+    if args.compare:
+        worktree = tempfile.mkdtemp(prefix='pmd-baseline-')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.compare], cwd=ROOT, check=True, capture_output=True)
+        try:
+            report(args.compare, measure(worktree, args.runs))
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, check=True)
+    report('working tree', measure(ROOT, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Vault health report for a vault full of weak and reused passwords.
+
+    python bench/health.py --sizes 1000 10000 --requests 10
+
+Every row gets one of a few short passwords, so each row is both weak and
+reused: the worst case for the report. Times /manager/health (counts and the
+first entries of each section) and one page of /manager/health/reused, and
+prints the HTML size. The summary should stay well under a second at 10k rows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginapp import create_app, db, encryption, hashing
+from loginapp.health import health_columns
+from loginapp.models import User, PasswordManager
+from loginapp.schema import bootstrap
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'Bench#1234'
+TARGET_MS = 1000
+
+
+def timed(client, path, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path, headers={'Accept-Encoding': 'identity'})
+        size = len(response.get_data())
+        samples.append(time.perf_counter() - start)
+    assert response.status_code == 200, (path, response.status_code)
+    return statistics.median(samples) * 1000, size
+
+
+def grow(app, user_id, vault_key, have, want):
+    with app.app_context():
+        cipher = encryption.owner_cipher(vault_key, user_id)
+        passwords = [f'pw{i}' for i in range(20)]
+        columns = {password: health_columns(password, cipher.fingerprint_key) for password in passwords}
+        rows = []
+        for i in range(have, want):
+            password = passwords[i % len(passwords)]
+            rows.append(dict(webaddress=f'https://site{i}.example.com', username=f'user{i}', email=EMAIL,
+                             password=cipher.encrypt(password), owner_id=user_id, **columns[password]))
+        if rows:
+            db.session.execute(PasswordManager.__table__.insert(), rows)
+            db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--requests', type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pmd-bench-')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'EXT_DB_PATH': os.path.join(workdir, 'ext.db'),
+        'WTF_CSRF_ENABLED': False,
+        'THROTTLE_ENABLED': False,
+        'HASH_POOL_SIZE': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'VAULT_KDF_N': 2 ** 10,
+    })
+    bootstrap(app)
+    with app.app_context():
+        user = User(name='bench', email=EMAIL, password=hashing.generate_password_hash(PASSWORD))
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+    with app.app_context():
+        vault_key = encryption.unlock(User.query.get(user_id), PASSWORD)
+
+    print(f"{'rows':>8} {'summary ms':>11} {'summary KB':>11} {'section ms':>11} {'section KB':>11}  target")
+    have = 0
+    for size in sorted(args.sizes):
+        grow(app, user_id, vault_key, have, size)
+        have = size
+        summary, summary_size = timed(client, '/manager/health', args.requests)
+        section, section_size = timed(client, '/manager/health/reused', args.requests)
+        verdict = 'ok' if summary < TARGET_MS else 'MISSED'
+        print(f"{size:>8} {summary:>11.1f} {summary_size / 1024:>11.1f} {section:>11.1f} {section_size / 1024:>11.1f}  {verdict}")
+
+
+if __name__ == '__main__':
+    main()
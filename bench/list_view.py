@@ -0,0 +1,92 @@
+"""
+Cost of the vault list view as the vault grows, now that passwords are encrypted.
+
+    python bench/list_view.py --sizes 100 1000 10000 50000 --requests 50
+
+For each vault size it times the first page of /manager/display, revealing one
+password, and exporting (decrypting) the whole vault. The list and reveal should
+stay flat; only the export grows with the vault. Runs against a throwaway
+SQLite database through the Flask test client.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginapp import create_app, db, encryption, hashing
+from loginapp.health import health_columns
+from loginapp.models import User, PasswordManager
+from loginapp.schema import bootstrap
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'Bench#1234'
+
+
+def timed(fn, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def grow(app, user_id, vault_key, have, want):
+    with app.app_context():
+        cipher = encryption.owner_cipher(vault_key, user_id)
+        columns = health_columns(PASSWORD, cipher.fingerprint_key) # the same for every row, the point is the encryption
+        rows = [dict(webaddress=f'https://site{i}.example.com', username=f'user{i}', email=EMAIL,
+                     password=cipher.encrypt(f'Site{i}#pw'), owner_id=user_id, **columns)
+                for i in range(have, want)]
+        if rows:
+            db.session.execute(PasswordManager.__table__.insert(), rows)
+            db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--kdf-n', type=int, default=2 ** 14, help='scrypt cost for the one login')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='pmd-bench-')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'EXT_DB_PATH': os.path.join(workdir, 'ext.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_SIZE': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'VAULT_KDF_N': args.kdf_n,
+    })
+    bootstrap(app)
+    with app.app_context():
+        user = User(name='bench', email=EMAIL, password=hashing.generate_password_hash(PASSWORD))
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+    with app.app_context():
+        vault_key = encryption.unlock(User.query.get(user_id), PASSWORD)
+
+    print(f"{'rows':>8} {'display ms':>11} {'reveal ms':>10} {'export ms':>10}")
+    have = 0
+    for size in sorted(args.sizes):
+        grow(app, user_id, vault_key, have, size)
+        have = size
+        with app.app_context():
+            sl = db.session.query(PasswordManager.sl).filter_by(owner_id=user_id).order_by(PasswordManager.sl.desc()).limit(1).scalar()
+        display = timed(lambda: client.get('/manager/display').get_data(), args.requests)
+        reveal = timed(lambda: client.post(f'/api/vault/{sl}/reveal').get_data(), args.requests)
+        export = timed(lambda: client.get('/manager/export').get_data(), max(1, args.requests // 10))
+        print(f"{size:>8} {display:>11.2f} {reveal:>10.2f} {export:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
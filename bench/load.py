@@ -0,0 +1,302 @@
+"""
+Load test for the dashboard's hot routes, runs fully offline.
+
+    python bench/load.py --users 20 --rows 500 --concurrency 8 --duration 15 --out results.json
+    python bench/load.py --server --out results.json --compare baseline.json
+
+Seeds throwaway copies of test.db and ext.db with --users users of --rows
+entries each, then drives /login, /manager/display, /manager/add,
+/update/<sl> and /save_password from --concurrency threads, either through
+the Flask test client or (with --server) over HTTP against a local WSGI
+server. A request only counts as done when it gets the status (and redirect
+target) the route gives a logged in user; anything else is an error, and the
+run stops if a worker cannot log in at all. Prints throughput and p50/p95/p99 latency per route and writes them
+as JSON, tagged with the current git commit, so runs can be compared.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loginapp import create_app, db, hashing
+from loginapp.models import User, PasswordManager
+from loginapp.schema import bootstrap
+
+WORKDIR = tempfile.mkdtemp(prefix='pmd-bench-')
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(WORKDIR, 'bench.db'),
+    'EXT_DB_PATH': os.path.join(WORKDIR, 'ext.db'),
+    'WTF_CSRF_ENABLED': False,
+    'THROTTLE_ENABLED': False, # every client comes from 127.0.0.1
+})
+
+PASSWORD = 'Bench#1234'
+# route -> share of the request mix
+MIX = {
+    'display': 40,
+    'save_password': 20,
+    'add': 15,
+    'update': 15,
+    'login': 10,
+}
+# route -> (status, redirect path) a logged in user gets
+EXPECTED = {
+    'display': (200, None),
+    'save_password': (200, None),
+    'add': (302, '/manager/display'),
+    'update': (302, '/manager/display'),
+    'login': (302, '/manager'),
+}
+
+
+def seed(users, rows, ext_rows):
+    bootstrap(app)
+    with app.app_context():
+        # one hash for everyone, seeding should not be dominated by bcrypt
+        pw_hash = hashing.generate_password_hash(PASSWORD)
+        db.session.execute(User.__table__.insert(), [
+            {'name': f'user{i}', 'email': f'user{i}@example.com', 'password': pw_hash, 'image_file': 'default.jpg'}
+            for i in range(users)])
+        db.session.commit()
+        accounts = {user.email: user.id for user in User.query.all()}
+        for email, user_id in accounts.items():
+            batch = []
+            for j in range(rows):
+                password = f'Site{j}#{user_id}x'
+                batch.append(dict(webaddress=f'https://site{j}.example.com', username=f'user{user_id}',
+                                  email=email, password=password, owner_id=user_id))
+            db.session.execute(PasswordManager.__table__.insert(), batch)
+        db.session.commit()
+        entries = {}
+        for sl, owner_id in db.session.query(PasswordManager.sl, PasswordManager.owner_id):
+            entries.setdefault(owner_id, []).append(sl)
+    conn = sqlite3.connect(app.config['EXT_DB_PATH'])
+    conn.executemany("INSERT INTO credentials (web_url, password) VALUES (?, ?)",
+                     ((f'https://ext{i}.example.com', f'Ext#{i}pw') for i in range(ext_rows)))
+    conn.commit()
+    conn.close()
+    return [(email, entries.get(user_id, [])) for email, user_id in accounts.items()]
+
+
+def _redirect_path(location):
+    return urllib.parse.urlsplit(location).path if location else None
+
+
+class TestClient:
+    """ get() and post() return (status, redirect path or None). """
+    def __init__(self):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        response.get_data() # drain streamed bodies
+        return response.status_code, _redirect_path(response.location)
+
+    def post(self, path, data=None, json_body=None):
+        response = self.client.post(path, data=data, json=json_body)
+        response.get_data()
+        return response.status_code, _redirect_path(response.location)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, _redirect_path(response.headers.get('Location'))
+        except urllib.error.HTTPError as e:
+            # redirects are not followed, they end up here too
+            e.read()
+            return e.code, _redirect_path(e.headers.get('Location'))
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data=None, json_body=None):
+        if json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        else:
+            body, content_type = urllib.parse.urlencode(data or {}).encode(), 'application/x-www-form-urlencoded'
+        return self._open(urllib.request.Request(self.base_url + path, data=body, headers={'Content-Type': content_type}))
+
+
+def worker(make_client, accounts, deadline, rng, results, lock):
+    email, entries = rng.choice(accounts)
+    client = make_client()
+    if client.post('/login', data={'email': email, 'password': PASSWORD}) != EXPECTED['login']:
+        with lock:
+            results['login_failures'].append(email)
+        return
+    routes, weights = zip(*MIX.items())
+    local = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    while time.perf_counter() < deadline:
+        route = rng.choices(routes, weights)[0]
+        if route == 'update' and not entries:
+            route = 'display'
+        start = time.perf_counter()
+        if route == 'display':
+            status = client.get('/manager/display')
+        elif route == 'add':
+            status = client.post('/manager/add', data={'webaddress': f'https://new{rng.randrange(10**6)}.example.com',
+                                                       'username': 'bench', 'email': email, 'password': PASSWORD})
+        elif route == 'update':
+            sl = rng.choice(entries)
+            status = client.post(f'/update/{sl}', data={'webaddress': f'https://upd{sl}.example.com',
+                                                       'username': 'bench', 'email': email, 'password': PASSWORD})
+        elif route == 'save_password':
+            status = client.post('/save_password', json_body={'web_url': f'https://ext{rng.randrange(10**6)}.example.com',
+                                                              'password': PASSWORD})
+        else:
+            # a fresh session so the login really checks the password
+            status = make_client().post('/login', data={'email': email, 'password': PASSWORD})
+        local[route].append(time.perf_counter() - start)
+        if status != EXPECTED[route]:
+            errors[route] += 1
+    with lock:
+        for route in routes:
+            results['latencies'][route].extend(local[route])
+            results['errors'][route] += errors[route]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summarise(results, elapsed):
+    summary = {}
+    for route, latencies in results['latencies'].items():
+        latencies.sort()
+        ms = lambda value: None if value is None else round(value * 1000, 3)
+        summary[route] = {
+            'requests': len(latencies),
+            'errors': results['errors'][route],
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50_ms': ms(percentile(latencies, 50)),
+            'p95_ms': ms(percentile(latencies, 95)),
+            'p99_ms': ms(percentile(latencies, 99)),
+        }
+    total = sum(item['requests'] for item in summary.values())
+    summary['total'] = {'requests': total, 'errors': sum(results['errors'].values()),
+                        'throughput_rps': round(total / elapsed, 2)}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(summary, baseline=None):
+    print(f"{'route':<15}{'reqs':>8}{'errs':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, item in summary.items():
+        if route == 'total':
+            continue
+        fmt = lambda value: f"{value:10.2f}" if value is not None else f"{'-':>10}"
+        line = f"{route:<15}{item['requests']:>8}{item['errors']:>6}{item['throughput_rps']:>10.1f}"
+        line += fmt(item['p50_ms']) + fmt(item['p95_ms']) + fmt(item['p99_ms'])
+        old = (baseline or {}).get(route)
+        if old and old.get('p95_ms') and item['p95_ms']:
+            line += f"   p95 {(item['p95_ms'] / old['p95_ms'] - 1) * 100:+.1f}%  rps {(item['throughput_rps'] / old['throughput_rps'] - 1) * 100:+.1f}%"
+        print(line)
+    total = summary['total']
+    print(f"{'total':<15}{total['requests']:>8}{total['errors']:>6}{total['throughput_rps']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=500, help='PasswordManager rows per user')
+    parser.add_argument('--ext-rows', type=int, default=10000, help='credentials seeded into ext.db')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15, help='seconds of load')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bcrypt-rounds', type=int, default=app.config['BCRYPT_LOG_ROUNDS'])
+    parser.add_argument('--server', action='store_true', help='go over HTTP to a local WSGI server instead of the test client')
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    app.config['BCRYPT_LOG_ROUNDS'] = args.bcrypt_rounds
+    accounts = seed(args.users, args.rows, args.ext_rows)
+
+    server = None
+    if args.server:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        make_client = lambda: HTTPClient(base_url)
+    else:
+        make_client = TestClient
+
+    results = {'latencies': {route: [] for route in MIX}, 'errors': {route: 0 for route in MIX}, 'login_failures': []}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=worker, args=(make_client, accounts, deadline, random.Random(args.seed + i), results, lock))
+               for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.shutdown()
+    hashing.shutdown_pool()
+    if results['login_failures']:
+        sys.exit(f"login failed for {', '.join(sorted(set(results['login_failures'])))}, nothing was measured")
+
+    summary = summarise(results, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_table(summary, baseline)
+
+    if args.out:
+        report = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'mode': 'wsgi' if args.server else 'test_client',
+            'params': {key: value for key, value in vars(args).items() if key not in ('out', 'compare')},
+            'elapsed_s': round(elapsed, 3),
+            'results': summary,
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Login throughput at several bcrypt pool sizes.
+
+    python bench/login_throughput.py --pool-sizes 0 1 2 4 --clients 16 --logins 200
+
+Runs against a throwaway SQLite database through the Flask test client,
+so it needs no server, SMTP or network access.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginapp import create_app, db, hashing
+from loginapp.models import User
+
+app = create_app({'WTF_CSRF_ENABLED': False, 'THROTTLE_ENABLED': False})
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'bench1234!'
+
+
+def login_once(_):
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+    return response.status_code, time.perf_counter() - start
+
+
+def run(pool_size, clients, logins):
+    app.config['HASH_POOL_SIZE'] = pool_size
+    app.config['HASH_QUEUE_SIZE'] = max(1, logins)
+    hashing.shutdown_pool()
+    if pool_size:
+        # start the workers before timing
+        hashing.generate_password_hash(PASSWORD)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(login_once, range(logins)))
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for status, _ in results if status == 302)
+    latencies = sorted(latency for _, latency in results)
+    return {
+        'pool_size': pool_size,
+        'ok': ok,
+        'logins_per_sec': logins / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[0, 1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=app.config['BCRYPT_LOG_ROUNDS'])
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+    app.config['HASH_POOL_SIZE'] = 0
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(name='bench', email=EMAIL, password=hashing.generate_password_hash(PASSWORD)))
+        db.session.commit()
+
+        print(f"bcrypt cost {args.rounds}, {args.clients} clients, {args.logins} logins")
+        print(f"{'pool':>5} {'ok':>5} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+        for pool_size in args.pool_sizes:
+            r = run(pool_size, args.clients, args.logins)
+            print(f"{r['pool_size']:>5} {r['ok']:>5} {r['logins_per_sec']:>10.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f}")
+        hashing.shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
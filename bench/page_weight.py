@@ -0,0 +1,130 @@
+"""
+Page weight: bytes on the wire and render time for the main pages.
+
+    python bench/page_weight.py --requests 50
+    python bench/page_weight.py --requests 50 --compare HEAD~1
+
+Each page is fetched through the Flask test client, logged in (login and
+register without a session), uncompressed and with Accept-Encoding gzip and
+br. `css` is the local stylesheets the page links, fetched the same way; `repeat` is what a second visit costs when the
+browser may keep everything marked immutable. render ms is the median over
+--requests uncompressed fetches. With --compare the same is measured in a git
+worktree of that revision.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ANONYMOUS_PAGES = ['/login', '/register']
+PAGES = ['/', '/login', '/register', '/manager', '/manager/display', '/manager/add', '/manager/health',
+         '/generate_password', '/manager/account', '/api/vault']
+
+# runs inside the child interpreter, prints one JSON line per page
+PROBE = r"""
+import json, os, re, statistics, sys, time
+from loginapp import create_app, db, hashing
+from loginapp.models import User
+from loginapp.schema import bootstrap
+
+workdir = os.environ['WORKDIR']
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+    'EXT_DB_PATH': os.path.join(workdir, 'ext.db'),
+    'WTF_CSRF_ENABLED': False,
+    'THROTTLE_ENABLED': False,
+    'HASH_POOL_SIZE': 0,
+    'BCRYPT_LOG_ROUNDS': 4,
+    'VAULT_KDF_N': 2 ** 10,
+})
+bootstrap(app)
+with app.app_context():
+    db.session.add(User(name='bench', email='bench@example.com', password=hashing.generate_password_hash('Bench#1234')))
+    db.session.commit()
+client = app.test_client()
+client.post('/login', data={'email': 'bench@example.com', 'password': 'Bench#1234'})
+for _ in range(5):
+    client.post('/manager/add', data={'webaddress': 'https://example.com', 'username': 'bench',
+                                      'email': 'bench@example.com', 'password': 'Site#1234pw'})
+
+# the login and register pages redirect a logged in user, so they are fetched without a session
+anonymous = app.test_client()
+
+def fetch(client, path, encoding):
+    response = client.get(path, headers={'Accept-Encoding': encoding})
+    return response, len(response.get_data())
+
+for path in json.loads(os.environ['PAGES']):
+    row = {'path': path}
+    page_client = anonymous if path in json.loads(os.environ['ANONYMOUS_PAGES']) else client
+    # stylesheet links are read from the uncompressed page
+    page, _ = fetch(page_client, path, 'identity')
+    hrefs = [href.decode() for href in re.findall(rb'<link rel="stylesheet" href="(/[^"]+)"', page.get_data())]
+    for encoding in ('identity', 'gzip', 'br'):
+        response, size = fetch(page_client, path, encoding)
+        row['status'] = response.status_code
+        css = repeat = 0
+        for href in hrefs:
+            sheet, sheet_size = fetch(page_client, href, encoding)
+            css += sheet_size
+            if 'immutable' not in sheet.headers.get('Cache-Control', ''):
+                repeat += sheet_size
+        row[encoding] = {'html': size, 'css': css, 'repeat': size + repeat,
+                         'encoding': response.headers.get('Content-Encoding', '-')}
+    samples = []
+    for _ in range(int(os.environ['REQUESTS'])):
+        start = time.perf_counter()
+        page_client.get(path, headers={'Accept-Encoding': 'identity'}).get_data()
+        samples.append(time.perf_counter() - start)
+    row['render_ms'] = statistics.median(samples) * 1000
+    print(json.dumps(row))
+"""
+
+
+def measure(tree, requests):
+    workdir = tempfile.mkdtemp(prefix='pmd-weight-')
+    env = dict(os.environ, WORKDIR=workdir, PAGES=json.dumps(PAGES), ANONYMOUS_PAGES=json.dumps(ANONYMOUS_PAGES),
+               REQUESTS=str(requests), JINJA_BYTECODE_CACHE_DIR=os.path.join(workdir, 'jinja_cache'))
+    try:
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=tree, env=env,
+                                check=True, capture_output=True, text=True).stdout
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+
+def report(label, rows):
+    print(label)
+    print(f"  {'page':<20} {'status':>6} {'html':>8} {'css':>8} {'gzip':>8} {'+css':>8} {'br':>8} {'+css':>8} {'repeat':>8} {'render ms':>10}")
+    for row in rows:
+        plain, gz, br = row['identity'], row['gzip'], row['br']
+        print(f"  {row['path']:<20} {row['status']:>6} {plain['html']:>8} {plain['css']:>8} {gz['html']:>8} {gz['css']:>8}"
+              f" {br['html']:>8} {br['css']:>8} {gz['repeat']:>8} {row['render_ms']:>10.2f}")
+    total = lambda encoding, key: sum(row[encoding][key] for row in rows)
+    print(f"  {'total':<20} {'':>6} {total('identity', 'html'):>8} {total('identity', 'css'):>8} {total('gzip', 'html'):>8}"
+          f" {total('gzip', 'css'):>8} {total('br', 'html'):>8} {total('br', 'css'):>8} {total('gzip', 'repeat'):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--compare', help='git revision to measure as the baseline')
+    args = parser.parse_args()
+
+    if args.compare:
+        worktree = tempfile.mkdtemp(prefix='pmd-baseline-')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.compare], cwd=ROOT, check=True, capture_output=True)
+        try:
+            report(args.compare, measure(worktree, args.requests))
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, check=True)
+    report('working tree', measure(ROOT, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Password generation: the old random.choice loop against the policy-aware generator.
+
+    python bench/password_generation.py --count 10000 --length 16
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginapp.passwords import DEFAULT_POLICY, generate_passwords
+
+
+def old_generate_random_password(length, include_special, include_numbers):
+    # the implementation generate_random_password() had before passwords.py
+    characters = string.ascii_letters
+    if include_numbers:
+        characters += string.digits
+    if include_special:
+        characters += string.punctuation
+    return ''.join(random.choice(characters) for _ in range(length))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--length', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    classes = DEFAULT_POLICY.classes()
+
+    cases = {
+        'random.choice, one at a time': lambda: [old_generate_random_password(args.length, True, True) for _ in range(args.count)],
+        'generate_passwords, one at a time': lambda: [generate_passwords(1, args.length, classes)[0] for _ in range(args.count)],
+        'generate_passwords, one batch': lambda: generate_passwords(args.count, args.length, classes),
+    }
+    print(f"{args.count} passwords of length {args.length}, best of {args.repeat}")
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:<36} {best * 1000:9.1f} ms  {args.count / best:12.0f} passwords/s")
+
+    old = [old_generate_random_password(args.length, True, True) for _ in range(args.count)]
+    new = generate_passwords(args.count, args.length, classes)
+    print(f"rejected by the form rules: old {sum(1 for p in old if DEFAULT_POLICY.errors(p))}, "
+          f"new {sum(1 for p in new if DEFAULT_POLICY.errors(p))}")
+
+
+if __name__ == '__main__':
+    main()
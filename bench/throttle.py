@@ -0,0 +1,117 @@
+"""
+Login throttle under attack load.
+
+    python bench/throttle.py --threads 8 --seconds 3
+    python bench/throttle.py --logins 300 --rounds 12
+
+First the limiters on their own: decisions per second for one hot account
+(everything after the burst is rejected) and for a spray over many keys,
+with the in-memory limiter at 1 and 64 shards and with the SQLite backend.
+Then /login with a wrong password through the Flask test client, throttle
+off and on: with it on, attempts past the burst are answered with a 429
+without touching bcrypt.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginapp import create_app, db, hashing
+from loginapp.models import User
+from loginapp.throttle import MemoryLimiter, SQLiteLimiter
+
+EMAIL = 'victim@example.com'
+PASSWORD = 'Bench#1234'
+
+
+def hammer(limiter, threads, seconds, keys):
+    """ Returns (decisions per second, share rejected). keys: None for one hot key, else how many to spray over. """
+    counts = []
+    deadline = time.perf_counter() + seconds
+
+    def run(seed):
+        rng = random.Random(seed)
+        allowed = rejected = 0
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                key = 'hot' if keys is None else f'10.{rng.randrange(keys)}'
+                if limiter.allow(key):
+                    rejected += 1
+                else:
+                    allowed += 1
+        counts.append((allowed, rejected))
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    allowed = sum(a for a, _ in counts)
+    rejected = sum(r for _, r in counts)
+    return (allowed + rejected) / seconds, rejected / max(1, allowed + rejected)
+
+
+def limiter_table(args):
+    burst, rate = 10, 1 / 30
+    tmpdir = tempfile.mkdtemp()
+    backends = [
+        ('memory, 1 shard', lambda: MemoryLimiter(burst, rate, shards=1)),
+        ('memory, 64 shards', lambda: MemoryLimiter(burst, rate, shards=64)),
+        ('sqlite', lambda: SQLiteLimiter(os.path.join(tmpdir, f'throttle{random.random()}.db'), 'bench', burst, rate)),
+    ]
+    print(f"{args.threads} threads, {args.seconds}s per run, burst {burst}, {rate * 60:g}/min")
+    print(f"{'backend':<20} {'pattern':<14} {'decisions/s':>12} {'rejected':>9} {'buckets':>8}")
+    for label, make in backends:
+        for pattern, keys in (('hot account', None), (f'spray {args.keys}', args.keys)):
+            limiter = make()
+            per_sec, rejected = hammer(limiter, args.threads, args.seconds, keys)
+            print(f"{label:<20} {pattern:<14} {per_sec:>12.0f} {rejected:>8.1%} {len(limiter):>8}")
+
+
+def login_table(args):
+    tmpdir = tempfile.mkdtemp()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+        'WTF_CSRF_ENABLED': False,
+        'HASH_POOL_SIZE': 0,
+        'BCRYPT_LOG_ROUNDS': args.rounds,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(name='victim', email=EMAIL, password=hashing.generate_password_hash(PASSWORD)))
+        db.session.commit()
+
+    print(f"\n{args.logins} wrong-password logins for one account, bcrypt cost {args.rounds}")
+    print(f"{'throttle':<10} {'logins/s':>10} {'429s':>6} {'hashed':>7}")
+    for enabled in (False, True):
+        app.config['THROTTLE_ENABLED'] = enabled
+        app.extensions.pop('throttle', None)
+        client = app.test_client()
+        statuses = []
+        start = time.perf_counter()
+        for _ in range(args.logins):
+            statuses.append(client.post('/login', data={'email': EMAIL, 'password': 'wrong-password'}).status_code)
+        elapsed = time.perf_counter() - start
+        rejected = statuses.count(429)
+        print(f"{'on' if enabled else 'off':<10} {args.logins / elapsed:>10.1f} {rejected:>6} {args.logins - rejected:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--keys', type=int, default=100000, help='distinct keys in the spray pattern')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=12)
+    args = parser.parse_args()
+    limiter_table(args)
+    login_table(args)
+
+
+if __name__ == '__main__':
+    main()
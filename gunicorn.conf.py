@@ -0,0 +1,64 @@
+"""
+Production server settings:
+
+    gunicorn -c gunicorn.conf.py
+
+The master runs schema.bootstrap() once and forks WEB_WORKERS processes,
+each serving up to WEB_THREADS requests at a time. A worker accepts at most
+WEB_MAX_CONNECTIONS connections; further clients wait in the listen backlog
+instead of piling up inside the app.
+
+Graceful reload: `kill -HUP <master pid>` starts workers with the new code
+and gives the old ones graceful_timeout seconds to finish their requests.
+This works because the master never imports loginapp: bootstrap runs in a
+child process and each worker imports the app itself.
+Workers are also replaced after max_requests requests.
+
+Each worker is its own process, so state that has to be the same in all of
+them (login throttle buckets, unlocked vault keys) defaults to the SQLite
+backends here. Unlocked vault keys are only shared when VAULT_SERVER_KEY is
+set, the key that wraps them on disk; without it each worker keeps its own
+and a user may be asked for their password again by another worker.
+
+Behind nginx or another proxy, set PROXY_FIX_HOPS to the number of proxies.
+Otherwise every client has the proxy's address and they all share one login
+throttle bucket.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+wsgi_app = 'wsgi:app'
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_connections = int(os.environ.get('WEB_MAX_CONNECTIONS', threads * 4)) # in-flight cap per worker
+backlog = 2048
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
+preload_app = False # each worker imports and builds its own app, so HUP loads new code
+
+# read by loginapp.config when the workers import it
+os.environ.setdefault('THROTTLE_BACKEND', 'sqlite')
+if os.environ.get('VAULT_SERVER_KEY'):
+    os.environ.setdefault('VAULT_KEY_STORE', 'sqlite')
+os.environ.setdefault('USER_CACHE_TTL', '30')
+os.environ.setdefault('SQLITE_POOL_SIZE', str(threads))
+# the workers already use every core, give each a share of the bcrypt pool
+os.environ.setdefault('HASH_POOL_SIZE', str(max(1, multiprocessing.cpu_count() // workers)))
+
+
+def on_starting(server):
+    # schema upgrade and ext.db setup, once, before any worker serves a request.
+    # In a child process: importing loginapp here would leave it in sys.modules for every worker forked after a HUP.
+    subprocess.run([sys.executable, '-m', 'loginapp.schema'], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+def post_worker_init(worker):
+    # every worker sends mail from the outbox, message leases keep them from sending one twice
+    from loginapp.outbox import outbox
+    outbox.start(worker.wsgi)
@@ -1,26 +1,58 @@
 import os
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
-from flask_login import LoginManager 
-from flask_mail import Mail
+from flask_login import LoginManager
+from loginapp.config import Config
 
-app = Flask(__name__)
-# app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')  # for form in forms.py otherwise forms does not work
-app.config['SECRET_KEY'] = '123456789' # for form in forms.py otherwise forms does not work
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db' # this line means where to create db
-
-db = SQLAlchemy(app) # creating the instance of sqlalchemy as db
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+# Extensions are created unbound and attached to an app in create_app().
+# Mail (and Pillow) are only imported when first used, see outbox.py and pictures.py.
+db = SQLAlchemy() # creating the instance of sqlalchemy as db
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'notification is-danger'
-app.config['MAIL_SERVER'] = 'smtp.googlemail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.environ.get('DB_USER') # email id     Do this with environment variable
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')   # password     Do this with environment variable
-app.config['MAIL_DEFAULT_SENDER'] = 'thisissujay12@gmail.com'  # Default sender
-mail = Mail(app)
 
-from loginapp import routes
+
+def create_app(config=None):
+    """
+    Build the app. `config` is a dict or config object applied on top of Config.
+    Nothing here touches a database; call schema.bootstrap(app) once before serving.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    if app.config['PROXY_FIX_HOPS']:
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    db.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir is None:
+        cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+    if cache_dir:
+        # templates are compiled once and reused by every worker and restart; a changed template is recompiled
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    # sqlite applies the SQLITE_* settings to every new database connection
+    from loginapp import assets, compression, encryption, hashing, metrics, models, sqlite, throttle
+    from loginapp.routes import main
+    app.register_blueprint(main)
+    assets.init_app(app)
+    compression.init_app(app)
+    encryption.init_app(app)
+    hashing.init_app(app)
+    metrics.init_app(app)
+    throttle.init_app(app)
+    models.user_cache.configure(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+    return app
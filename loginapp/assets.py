@@ -0,0 +1,84 @@
+"""
+Fingerprinted static assets.
+
+Templates link stylesheets with {{ asset_url('css/display.css') }}, which
+gives /assets/css/display.<hash>.css where <hash> is taken from the file's
+content. The URL changes whenever the file does, so it is served with a
+year long immutable Cache-Control and browsers never ask for it again.
+
+Files are read, hashed and compressed (see compression.py) once per process
+and served from memory. With debug on they are re-read when they change.
+"""
+import hashlib
+import mimetypes
+import os
+from flask import abort, current_app, Response, url_for
+from werkzeug.security import safe_join
+from loginapp.compression import compress, negotiate
+
+
+def static_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+
+class _Asset:
+    def __init__(self, path):
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()[:12]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.encoded = {}
+
+    def body(self, encoding):
+        if encoding is None:
+            return self.data
+        if encoding not in self.encoded:
+            self.encoded[encoding] = compress(self.data, encoding)
+        return self.encoded[encoding]
+
+
+def _load(filename):
+    """ The _Asset for a file under static/, or None. """
+    assets = current_app.extensions.setdefault('assets', {})
+    asset = assets.get(filename)
+    if asset is None or current_app.debug:
+        path = safe_join(static_dir(), filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        if asset is None or asset.mtime != os.path.getmtime(path):
+            asset = assets[filename] = _Asset(path)
+    return asset
+
+
+def asset_url(filename):
+    """ URL of a static file with its content hash in the name, e.g. css/home.css -> /assets/css/home.1a2b3c4d5e6f.css """
+    asset = _load(filename)
+    if asset is None:
+        return url_for('static', filename=filename)
+    stem, ext = os.path.splitext(filename)
+    return url_for('asset', filename=f'{stem}.{asset.digest}{ext}')
+
+
+def asset(filename):
+    stem, ext = os.path.splitext(filename)
+    stem, _, digest = stem.rpartition('.')
+    found = _load(stem + ext) if stem else None
+    if found is None:
+        abort(404)
+    encoding = negotiate() if found.mimetype in current_app.config['COMPRESS_MIMETYPES'] else None
+    response = Response(found.body(encoding), mimetype=found.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if digest == found.digest:
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config['ASSET_MAX_AGE']}, immutable"
+    else:
+        # a page rendered before the file changed: serve the current file, but do not let it be cached as that version
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_app(app):
+    app.add_url_rule('/assets/<path:filename>', 'asset', asset)
+    app.add_template_global(asset_url)
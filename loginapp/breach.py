@@ -0,0 +1,137 @@
+"""
+Offline check against the Have I Been Pwned password corpus.
+
+The public dump is a text file of "SHA1:COUNT" lines ordered by hash. `build`
+turns it into a binary file that is searched through mmap, so nothing is
+loaded up front and all workers share the same pages:
+
+    header   b'PWNDIDX1' + record count (uint64)
+    fanout   65537 uint64, index of the first record for each 2 byte hash prefix
+    records  18 byte hash suffix + uint32 count, sorted
+
+Build it with:
+
+    python -m loginapp.breach build pwned-passwords-sha1-ordered-by-hash.txt breached.bin
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+
+MAGIC = b'PWNDIDX1'
+HEADER = struct.Struct('>8sQ')
+FANOUT = struct.Struct('>65537Q')
+PREFIX_SIZE = 2
+SUFFIX_SIZE = 20 - PREFIX_SIZE
+RECORD = struct.Struct(f'>{SUFFIX_SIZE}sI')
+RECORDS_START = HEADER.size + FANOUT.size
+
+
+class BreachCorpus:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a breached password index")
+        self.fanout = FANOUT.unpack_from(self.map, HEADER.size)
+
+    def count_digest(self, digest):
+        """ How often a SHA-1 digest (20 bytes) appears in the corpus, 0 if never. """
+        prefix = int.from_bytes(digest[:PREFIX_SIZE], 'big')
+        suffix = digest[PREFIX_SIZE:]
+        lo, hi = self.fanout[prefix], self.fanout[prefix + 1]
+        data = self.map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = RECORDS_START + mid * RECORD.size
+            candidate = data[offset:offset + SUFFIX_SIZE]
+            if candidate < suffix:
+                lo = mid + 1
+            elif candidate > suffix:
+                hi = mid
+            else:
+                return RECORD.unpack_from(data, offset)[1]
+        return 0
+
+    def count(self, password):
+        return self.count_digest(hashlib.sha1(password.encode('utf-8')).digest())
+
+    def count_many(self, passwords):
+        """
+        Bulk check. Lookups run in hash order, so pages of the file are visited
+        front to back once. Returns counts in the order of `passwords`.
+        """
+        digests = [hashlib.sha1(password.encode('utf-8')).digest() for password in passwords]
+        counts = [0] * len(digests)
+        for index in sorted(range(len(digests)), key=digests.__getitem__):
+            counts[index] = self.count_digest(digests[index])
+        return counts
+
+    def close(self):
+        self.map.close()
+
+
+_corpus = None
+_lock = threading.Lock()
+
+def get_corpus(path):
+    """ The corpus at `path`, opened once per process. None when no corpus is configured. """
+    global _corpus
+    if not path or not os.path.exists(path):
+        return None
+    if _corpus is None or _corpus.path != path:
+        with _lock:
+            if _corpus is None or _corpus.path != path:
+                _corpus = BreachCorpus(path)
+    return _corpus
+
+
+def build(source, target):
+    """ Convert the sorted HIBP text dump into the binary index. Streams, memory use stays flat. """
+    fanout = [0] * 65537
+    count = 0
+    previous = b''
+    with open(source, 'r', encoding='ascii') as lines, open(target, 'wb') as out:
+        out.write(b'\0' * RECORDS_START)
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            hex_hash, _, times = line.partition(':')
+            digest = bytes.fromhex(hex_hash)
+            if len(digest) != 20:
+                raise ValueError(f"line {count + 1}: not a SHA-1 hash: {hex_hash!r}")
+            if digest <= previous:
+                raise ValueError(f"line {count + 1}: input must be ordered by hash (use the 'ordered by hash' dump)")
+            previous = digest
+            fanout[int.from_bytes(digest[:PREFIX_SIZE], 'big') + 1] += 1
+            out.write(RECORD.pack(digest[PREFIX_SIZE:], min(int(times or 1), 0xFFFFFFFF)))
+            count += 1
+        for prefix in range(1, 65537):
+            fanout[prefix] += fanout[prefix - 1]
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, count))
+        out.write(FANOUT.pack(*fanout))
+    return count
+
+
+def main(argv):
+    if len(argv) == 3 and argv[0] == 'build':
+        count = build(argv[1], argv[2])
+        print(f"Wrote {count} hashes to {argv[2]}")
+    elif len(argv) == 3 and argv[0] == 'check':
+        corpus = BreachCorpus(argv[1])
+        print(f"Seen {corpus.count(argv[2])} times")
+    else:
+        print("usage: python -m loginapp.breach build <pwned-passwords.txt> <output.bin>\n"
+              "       python -m loginapp.breach check <output.bin> <password>")
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
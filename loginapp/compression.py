@@ -0,0 +1,97 @@
+"""
+gzip / brotli compression of text responses (HTML, JSON, CSS, ...).
+
+The encoding is negotiated from Accept-Encoding, brotli first when the
+`brotli` package is installed. Buffered responses are compressed when they
+are at least COMPRESS_MIN_SIZE bytes. Streamed responses (display(), export)
+are compressed chunk by chunk and flushed every STREAM_FLUSH_SIZE bytes, so
+the browser still gets the page progressively. Files sent with send_file
+and responses that already have a Content-Encoding are left alone.
+"""
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STREAM_FLUSH_SIZE = 16 * 1024
+
+
+def encodings():
+    """ Content-Encodings we can produce, in order of preference. """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def negotiate():
+    """ The encoding to use for the current request, or None. """
+    return request.accept_encodings.best_match(encodings())
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+            self.compress, self.flush, self.finish = self.compressor.process, self.compressor.flush, self.compressor.finish
+        else:
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self.compressor = zlib.compressobj(current_app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = self.compressor.compress
+            self.flush = lambda: self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = self.compressor.flush
+
+    def __call__(self, chunks):
+        pending = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = self.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_SIZE:
+                data += self.flush()
+                pending = 0
+            if data:
+                yield data
+        yield self.finish()
+
+
+def compress_response(response):
+    config = current_app.config
+    if (not config['COMPRESS_ENABLED'] or response.mimetype not in config['COMPRESS_MIMETYPES']
+            or response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in response.headers:
+        return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        body = response.response
+        response.response = _StreamCompressor(encoding)(body)
+        if hasattr(body, 'close'):
+            response.call_on_close(body.close)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # the compressed bytes differ from the uncompressed ones, so a strong ETag would be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
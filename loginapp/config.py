@@ -0,0 +1,100 @@
+import os
+from sqlalchemy.pool import QueuePool
+
+
+class Config:
+    """ Default settings. create_app(config) overrides them with a dict or another config object. """
+    # SECRET_KEY = os.environ.get('SECRET_KEY')  # for form in forms.py otherwise forms does not work
+    SECRET_KEY = '123456789' # for form in forms.py otherwise forms does not work
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///test.db') # this line means where to create db
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite settings for test.db and ext.db, applied to every new connection by sqlite.py
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL') # FULL also syncs every commit
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)) # ms a writer waits for the lock before "database is locked"
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8)) # open connections per process, about one per server thread
+    SQLITE_MAX_OVERFLOW = int(os.environ.get('SQLITE_MAX_OVERFLOW', 8)) # extra connections opened under load and closed after
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # SQLAlchemy 1.4 uses NullPool for SQLite files, a new connection (and PRAGMAs) per checkout
+        'poolclass': QueuePool,
+        'pool_size': SQLITE_POOL_SIZE,
+        'max_overflow': SQLITE_MAX_OVERFLOW,
+        'pool_timeout': 30,
+        'connect_args': {'check_same_thread': False}, # pooled connections move between threads
+    }
+
+    DISPLAY_PAGE_SIZE = int(os.environ.get('DISPLAY_PAGE_SIZE', 100)) # rows per page on /manager/display
+    DISPLAY_MAX_PAGE_SIZE = 1000 # upper bound for the ?size= query argument
+
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)) # bcrypt cost, older hashes are upgraded on login
+    HASH_POOL_SIZE = int(os.environ.get('HASH_POOL_SIZE', os.cpu_count() or 1)) # worker processes for bcrypt, 0 hashes inline
+    HASH_QUEUE_SIZE = int(os.environ.get('HASH_QUEUE_SIZE', 4 * HASH_POOL_SIZE or 1)) # queued + running hashes before we answer 503
+    HASH_TIMEOUT = 10 # seconds to wait for a worker
+
+    THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') == '1' # token buckets on /login and /reset_password, see throttle.py
+    THROTTLE_BACKEND = os.environ.get('THROTTLE_BACKEND', 'memory') # 'sqlite' shares the buckets between worker processes
+    THROTTLE_SQLITE_PATH = os.environ.get('THROTTLE_SQLITE_PATH', 'throttle.db')
+    THROTTLE_LIMITS = { # name: (burst, tokens refilled per second)
+        'login_ip': (30, 1 / 2),
+        'login_account': (10, 1 / 30),
+        'reset_ip': (10, 1 / 30),
+        'reset_account': (3, 1 / 300),
+    }
+    THROTTLE_SHARDS = 64 # locks per in-memory limiter
+    # proxies (nginx, a load balancer) in front of the app; their X-Forwarded-For/-Proto/-Host headers are trusted
+    # for that many hops, so the throttle sees client IPs. Leave 0 when clients connect directly, or anyone can fake one.
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+    THROTTLE_MAX_KEYS = 100000 # buckets kept per in-memory limiter, oldest dropped beyond that
+
+    HEALTH_PREVIEW_SIZE = 10 # entries per section on /manager/health, the rest are on /manager/health/<section>
+    HEALTH_PAGE_SIZE = 100 # entries per page of /manager/health/<section>
+    BREACHED_PASSWORDS_PATH = os.environ.get('BREACHED_PASSWORDS_PATH') # built with `python -m loginapp.breach build`, check skipped when unset
+    GENERATE_MAX_COUNT = 10000 # passwords returned by one /api/generate call
+    IMPORT_CHUNK_SIZE = 500 # rows inserted per transaction by /manager/import
+    IMPORT_MAX_ERRORS = 1000 # row errors reported back before the rest are only counted
+
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1' # per request latency and SQL accounting
+    SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.1)) # seconds, slower statements are logged
+
+    # response size and template work, see compression.py and assets.py
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1' # off when a proxy in front already compresses
+    COMPRESS_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'text/csv', 'application/json', 'application/javascript')
+    COMPRESS_MIN_SIZE = 1024 # bytes, smaller bodies are sent as they are
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5 # 0-11, higher is smaller but much slower; needs the brotli package
+    ASSET_MAX_AGE = 365 * 24 * 3600 # /assets/ URLs carry a content hash, so they never change
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') # compiled templates kept across workers and restarts; instance/jinja_cache when unset, '' turns it off
+
+    AVATAR_SIZES = (64, 128, 256) # profile picture renditions in pixels
+    AVATAR_MAX_AGE = 365 * 24 * 3600 # picture files are named by content, so they never change
+
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024)) # users kept by the login user_loader cache
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300)) # seconds before a cached user is reloaded; per process, so keep it short with several workers
+
+    # vault encryption, see encryption.py. Changing the KDF settings rewraps each key at its owner's next login
+    VAULT_KDF_N = int(os.environ.get('VAULT_KDF_N', 2 ** 15)) # scrypt cost, about 32 MB and 50-100 ms per login at r=8
+    VAULT_KDF_R = 8
+    VAULT_KDF_P = 1
+    VAULT_SERVER_KEY = os.environ.get('VAULT_SERVER_KEY') # recovery copies of vault keys and ext.db encryption; both are off when unset
+    VAULT_KEY_STORE = os.environ.get('VAULT_KEY_STORE', 'memory') # 'sqlite' shares unlocked keys between worker processes, needs VAULT_SERVER_KEY
+    VAULT_KEY_STORE_PATH = os.environ.get('VAULT_KEY_STORE_PATH', 'vault_keys.db')
+    VAULT_KEY_CACHE_SIZE = 10000 # unlocked vault keys kept, one per logged in session
+    VAULT_KEY_TTL = 12 * 3600 # seconds before a session has to enter its password again
+
+    EXT_DB_PATH = os.environ.get('EXT_DB_PATH', 'ext.db') # credentials saved by the browser extension
+    EXT_DB_COMMIT_WINDOW = 0.005 # seconds concurrent /save_password calls are gathered into one commit
+    EXT_DB_COMMIT_ROWS = 500 # commit early once this many rows are waiting
+
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '1') == '1'
+    MAIL_USERNAME = os.environ.get('DB_USER') # email id     Do this with environment variable
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')   # password     Do this with environment variable
+    MAIL_DEFAULT_SENDER = 'thisissujay12@gmail.com'  # Default sender
+    MAIL_OUTBOX_BATCH = 50 # messages sent per SMTP connection
+    MAIL_OUTBOX_POLL = 5 # seconds between checks for due retries
+    MAIL_OUTBOX_LEASE = 120 # seconds a sender may hold a message before another one retries it
+    MAIL_OUTBOX_BACKOFF = 30 # first retry delay in seconds, doubled on each attempt
+    MAIL_OUTBOX_MAX_BACKOFF = 3600
+    MAIL_OUTBOX_MAX_ATTEMPTS = 8
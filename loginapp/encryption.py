@@ -0,0 +1,273 @@
+"""
+Encryption at rest for vault entries and ext.db credentials (AES-GCM).
+
+Envelope scheme: every user has a random 256 bit vault key that encrypts their
+PasswordManager rows. It is stored wrapped twice on the user row:
+
+- user.vault_key: under a key derived from the login password with scrypt
+  (VAULT_KDF_N/R/P). Unwrapped once at login; rewrapped when the KDF settings change.
+- user.vault_recovery: under the server's recovery key, so a password reset
+  can rewrap the vault key instead of losing the vault.
+
+The recovery copies and ext.db encryption need VAULT_SERVER_KEY. Without it
+there are no recovery copies (a password reset starts a new vault, the saved
+passwords are lost) and ext.db is stored as it arrives; SECRET_KEY is not a
+secret to rely on here.
+
+After login the key is kept server side (VAULT_KEY_STORE), wrapped under a
+server key and looked up by a random id kept in the Flask session; the
+cookie itself never holds key material. The 'sqlite' store puts the wrapped
+keys on disk, so it needs VAULT_SERVER_KEY; without it the in-memory store
+is used, with a per-process key. Views that list
+entries do not decrypt anything; a password is decrypted when it is revealed,
+edited or exported.
+
+Encrypted values look like "v1:" + base64(nonce + ciphertext). Anything else
+is a row saved before encryption, encrypted on the owner's next login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from flask import current_app, session
+from sqlalchemy import or_
+from loginapp import hashing
+from loginapp.cache import SQLiteTTLCache, TTLCache
+from loginapp.health import KEYED, fingerprint_key
+
+PREFIX = 'v1:'
+NONCE_SIZE = 12
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text.encode('ascii'))
+
+def is_encrypted(value):
+    return value is not None and value.startswith(PREFIX)
+
+
+class Cipher:
+    """
+    Encrypts and decrypts values with one key. `aad` ties the ciphertexts to
+    their owner, so a value copied into another user's row will not decrypt.
+    Build one per request and reuse it for every row, the key schedule is the expensive part.
+    Ciphers from owner_cipher() also carry the owner's key for health fingerprints.
+    """
+    def __init__(self, key, aad, fingerprint_key=None):
+        self.aead = AESGCM(key)
+        self.aad = aad
+        self.fingerprint_key = fingerprint_key
+
+    def encrypt(self, plaintext):
+        nonce = os.urandom(NONCE_SIZE)
+        return PREFIX + _b64encode(nonce + self.aead.encrypt(nonce, plaintext.encode('utf-8'), self.aad))
+
+    def decrypt(self, value):
+        if not is_encrypted(value):
+            return value
+        blob = _b64decode(value[len(PREFIX):])
+        return self.aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], self.aad).decode('utf-8')
+
+    def decrypt_rows(self, rows, skip_invalid=False):
+        """ Yield rows (tuples whose last column is encrypted) with that column decrypted. """
+        for *fields, value in rows:
+            try:
+                yield (*fields, self.decrypt(value))
+            except InvalidTag:
+                if not skip_invalid:
+                    raise
+
+    def count_invalid(self, values):
+        """ How many of the values do not decrypt with this key. """
+        invalid = 0
+        for value in values:
+            try:
+                self.decrypt(value)
+            except InvalidTag:
+                invalid += 1
+        return invalid
+
+
+def owner_cipher(key, owner_id):
+    return Cipher(key, f'password_manager:{owner_id}'.encode('ascii'), fingerprint_key(key, owner_id))
+
+
+def _derive(secret, label):
+    return hmac.new(secret.encode('utf-8'), label.encode('ascii'), hashlib.sha256).digest()
+
+def _server_key(label):
+    """ Keys held by the server, derived from VAULT_SERVER_KEY. None when that is unset. """
+    secret = current_app.config['VAULT_SERVER_KEY']
+    return _derive(secret, label) if secret else None
+
+def _kdf_params():
+    config = current_app.config
+    return config['VAULT_KDF_N'], config['VAULT_KDF_R'], config['VAULT_KDF_P']
+
+def _user_aad(user_id):
+    return f'vault_key:{user_id}'.encode('ascii')
+
+
+def _wrap_with_password(password, vault_key, user_id):
+    """ "scrypt$n$r$p$salt$nonce+ciphertext", the KDF settings travel with the wrapped key. """
+    n, r, p = _kdf_params()
+    salt = os.urandom(16)
+    nonce = os.urandom(NONCE_SIZE)
+    wrapped = AESGCM(hashing.derive_key(password, salt, n, r, p)).encrypt(nonce, vault_key, _user_aad(user_id))
+    return f'scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(nonce + wrapped)}'
+
+def _unwrap_with_password(password, stored, user_id):
+    _, n, r, p, salt, blob = stored.split('$')
+    blob = _b64decode(blob)
+    kek = hashing.derive_key(password, _b64decode(salt), int(n), int(r), int(p))
+    return AESGCM(kek).decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], _user_aad(user_id))
+
+def _wrap_for_recovery(vault_key, user_id):
+    """ None without VAULT_SERVER_KEY. """
+    recovery_key = _server_key('vault-recovery')
+    if recovery_key is None:
+        return None
+    nonce = os.urandom(NONCE_SIZE)
+    return _b64encode(nonce + AESGCM(recovery_key).encrypt(nonce, vault_key, _user_aad(user_id)))
+
+def _unwrap_for_recovery(stored, user_id):
+    blob = _b64decode(stored)
+    return AESGCM(_server_key('vault-recovery')).decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], _user_aad(user_id))
+
+
+def create_vault_key(user, password):
+    """ Give `user` (already flushed, so it has an id) a new vault key. Returns the key. """
+    vault_key = AESGCM.generate_key(bit_length=256)
+    user.vault_key = _wrap_with_password(password, vault_key, user.id)
+    user.vault_recovery = _wrap_for_recovery(vault_key, user.id)
+    return vault_key
+
+def unlock(user, password):
+    """
+    The user's vault key, given their correct login password.
+    Creates the key for users from before encryption, and rewraps it when the KDF settings changed.
+    """
+    if not user.vault_key:
+        return create_vault_key(user, password)
+    vault_key = _unwrap_with_password(password, user.vault_key, user.id)
+    if user.vault_key.split('$')[1:4] != [str(value) for value in _kdf_params()]:
+        user.vault_key = _wrap_with_password(password, vault_key, user.id)
+    if not user.vault_recovery:
+        # VAULT_SERVER_KEY was set after this key was made
+        user.vault_recovery = _wrap_for_recovery(vault_key, user.id)
+    return vault_key
+
+def reset(user, new_password):
+    """
+    After a password reset: rewrap the vault key under the new password using the recovery copy.
+    Without a usable recovery copy the user gets a new vault key, so they can still log in; entries
+    saved under the old key no longer decrypt (reveal, update and export report them). Returns False then.
+    """
+    if not user.vault_key:
+        return True
+    if user.vault_recovery and _server_key('vault-recovery') is not None:
+        try:
+            vault_key = _unwrap_for_recovery(user.vault_recovery, user.id)
+        except InvalidTag:
+            # VAULT_SERVER_KEY changed since this copy was made
+            current_app.logger.warning('vault recovery failed for user %s', user.id)
+        else:
+            user.vault_key = _wrap_with_password(new_password, vault_key, user.id)
+            return True
+    current_app.logger.warning('no recovery copy for user %s, saved passwords are lost with the reset', user.id)
+    create_vault_key(user, new_password)
+    return False
+
+
+def encrypt_plaintext_rows(db_session, owner_id, vault_key):
+    """
+    Encrypt the owner's rows saved before encryption, and recompute health fingerprints
+    made before they were keyed per user. Returns how many rows were rewritten.
+    """
+    from loginapp.models import PasswordManager
+    cipher = owner_cipher(vault_key, owner_id)
+    rows = db_session.query(PasswordManager).filter(
+        PasswordManager.owner_id == owner_id,
+        or_(~PasswordManager.password.startswith(PREFIX), ~PasswordManager.fingerprint.startswith(KEYED))).all()
+    count = 0
+    for field in rows:
+        try:
+            password = cipher.decrypt(field.password)
+        except InvalidTag:
+            continue
+        field.set_password(password, cipher)
+        count += 1
+    return count
+
+
+def _session_keys():
+    return current_app.extensions['vault_keys']
+
+def _session_wrap_key():
+    return current_app.extensions['vault_session_key']
+
+def remember_key(user_id, vault_key):
+    key_id = secrets.token_urlsafe(24)
+    nonce = os.urandom(NONCE_SIZE)
+    wrapped = AESGCM(_session_wrap_key()).encrypt(nonce, vault_key, key_id.encode('ascii'))
+    _session_keys().set(key_id, [user_id, _b64encode(nonce + wrapped)])
+    session['vault_key_id'] = key_id
+
+def current_key(user_id):
+    """ The vault key unlocked at login, or None (expired, "remember me" login). """
+    key_id = session.get('vault_key_id')
+    entry = _session_keys().get(key_id) if key_id else None
+    if entry is None or entry[0] != user_id:
+        return None
+    blob = _b64decode(entry[1])
+    try:
+        return AESGCM(_session_wrap_key()).decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], key_id.encode('ascii'))
+    except InvalidTag:
+        # stored under an earlier session key (VAULT_SERVER_KEY set or changed since)
+        return None
+
+def forget_key():
+    key_id = session.pop('vault_key_id', None)
+    if key_id:
+        _session_keys().invalidate(key_id)
+
+
+def init_app(app):
+    store = app.config['VAULT_KEY_STORE']
+    if store == 'sqlite' and not app.config['VAULT_SERVER_KEY']:
+        # the keys on disk would be wrapped under nothing secret
+        app.logger.warning("VAULT_KEY_STORE 'sqlite' needs VAULT_SERVER_KEY, using the in-memory store: "
+                           "each worker process asks for the password again to unlock the vault")
+        store = 'memory'
+    # 'sqlite' lets every worker process find a key unlocked by another one
+    if store == 'sqlite':
+        app.extensions['vault_keys'] = SQLiteTTLCache(app.config['VAULT_KEY_STORE_PATH'], app.config['VAULT_KEY_CACHE_SIZE'], app.config['VAULT_KEY_TTL'])
+    else:
+        app.extensions['vault_keys'] = TTLCache(app.config['VAULT_KEY_CACHE_SIZE'], app.config['VAULT_KEY_TTL'])
+    # wraps the unlocked keys in that store
+    if app.config['VAULT_SERVER_KEY']:
+        app.extensions['vault_session_key'] = _derive(app.config['VAULT_SERVER_KEY'], 'vault-session')
+    else:
+        app.extensions['vault_session_key'] = os.urandom(32)
+    if not app.config['VAULT_SERVER_KEY']:
+        app.logger.warning('VAULT_SERVER_KEY is not set: vault keys get no recovery copies (a password reset '
+                           'loses the saved passwords) and ext.db credentials are stored unencrypted')
+
+
+def ext_cipher():
+    """ ext.db credentials are saved by the extension without a login, so they use a server key. None without VAULT_SERVER_KEY. """
+    cipher = current_app.extensions.get('ext_cipher')
+    if cipher is None and _server_key('ext-db') is not None:
+        cipher = current_app.extensions.setdefault('ext_cipher', Cipher(_server_key('ext-db'), b'credentials'))
+    return cipher
+
+def ext_encrypt(password):
+    """ The value to store in ext.db for `password`. """
+    cipher = ext_cipher()
+    return cipher.encrypt(password) if cipher is not None else password
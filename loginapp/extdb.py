@@ -0,0 +1,150 @@
+import queue
+import sqlite3
+import threading
+import time
+from flask import current_app
+from loginapp.encryption import PREFIX
+from loginapp.sqlite import configure_connection
+
+# passwords arrive already encrypted by encryption.ext_encrypt() (when VAULT_SERVER_KEY is set)
+INSERT_CREDENTIALS = "INSERT INTO credentials (web_url, password) VALUES (?, ?)"
+
+
+def connect(path, **kwargs):
+    # WAL, busy_timeout and synchronous from the SQLITE_* config, the same as test.db
+    return configure_connection(sqlite3.connect(path, **kwargs))
+
+
+def init_db(path):
+    """ Create the credentials table. Run once when deploying or starting up. """
+    conn = connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS credentials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            web_url TEXT NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def encrypt_plaintext(path, cipher):
+    """ Encrypt credentials saved before encryption at rest. Returns how many there were. """
+    conn = connect(path)
+    with conn:
+        rows = conn.execute("SELECT id, password FROM credentials WHERE substr(password, 1, ?) != ?",
+                            (len(PREFIX), PREFIX)).fetchall()
+        conn.executemany("UPDATE credentials SET password = ? WHERE id = ?",
+                         [(cipher.encrypt(password), row_id) for row_id, password in rows])
+    conn.close()
+    return len(rows)
+
+
+def get_writer():
+    """ The app's GroupCommitWriter, created on first use. """
+    app = current_app._get_current_object()
+    writer = app.extensions.get('ext_db')
+    if writer is None:
+        writer = app.extensions.setdefault('ext_db', GroupCommitWriter(
+            app.config['EXT_DB_PATH'], window=app.config['EXT_DB_COMMIT_WINDOW'], max_rows=app.config['EXT_DB_COMMIT_ROWS']))
+    return writer
+
+
+class _Batch:
+    """ Rows from one request, plus a way for the request to wait until they are committed. """
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitWriter:
+    """
+    Owns the only write connection to ext.db.
+    Requests hand their rows to a background thread, which inserts everything
+    that arrives within `window` seconds (or until `max_rows` rows) with one
+    executemany and one commit, then wakes the waiting requests. If that commit
+    fails, each request's rows are retried in their own transaction, so one bad
+    request does not fail the others.
+    """
+    def __init__(self, path, window=0.005, max_rows=500):
+        self.path = path
+        self.window = window
+        self.max_rows = max_rows
+        self.queue = queue.Queue()
+        self.conn = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Open the connection and start the writer thread. write() does this on first use. """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.conn = connect(self.path, check_same_thread=False)
+            self.thread = threading.Thread(target=self._run, name='ext-db-writer', daemon=True)
+            self.thread.start()
+
+    def write(self, rows):
+        """ Insert rows as (web_url, password) tuples. Blocks until they are committed. """
+        if self.thread is None:
+            self.start()
+        batch = _Batch(rows)
+        self.queue.put(batch)
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            batches = [batch]
+            count = len(batch.rows)
+            deadline = time.monotonic() + self.window
+            stopping = False
+            while count < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if batch is None:
+                    stopping = True
+                    break
+                batches.append(batch)
+                count += len(batch.rows)
+            self._commit(batches)
+            if stopping:
+                return
+
+    def _commit(self, batches):
+        try:
+            with self.conn:
+                self.conn.executemany(INSERT_CREDENTIALS, [row for batch in batches for row in batch.rows])
+        except sqlite3.Error as e:
+            if len(batches) == 1:
+                batches[0].error = e
+            else:
+                # the group was rolled back; retry each request on its own so only the bad one fails
+                for batch in batches:
+                    try:
+                        with self.conn:
+                            self.conn.executemany(INSERT_CREDENTIALS, batch.rows)
+                    except sqlite3.Error as e:
+                        batch.error = e
+        for batch in batches:
+            batch.done.set()
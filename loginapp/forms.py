@@ -1,4 +1,3 @@
-import re
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from flask_login import current_user
@@ -8,39 +7,36 @@ from wtforms import validators
 import wtforms
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
 from loginapp.models import User
-from wtforms.validators import DataRequired, Length, Email, EqualTo, Regexp
+from loginapp.passwords import DEFAULT_POLICY
+from loginapp.breach import get_corpus
+from loginapp import pictures
+from flask import current_app
+from wtforms.validators import DataRequired, Length, Email, EqualTo
 
 
 def password_validator(form, field):
-    """ Custom password validator to enforce password rules. """
-    password = field.data
-    # Minimum 6 characters, maximum 20 characters
-    if len(password) < 6 or len(password) > 20:
-        raise ValidationError("Password must be between 6 and 20 characters.")
-
-    # Must contain at least one number
-    if not re.search(r'\d', password):
-        raise ValidationError("Password must contain at least one number.")
-
-    # Must contain at least one special character (excluding restricted ones)
-    if not re.search(r'[!@#$%^&*()_+={}[\]:;"\'<>,.?\\|`~]', password):
-        raise ValidationError("Password must contain at least one special character.")
-
-    # Must not contain `_`, `/`, or `,`
-    if re.search(r'[_/\,]', password):
-        raise ValidationError("Password cannot contain '_', '/', or ','.")
+    """ Custom password validator to enforce the shared password rules in passwords.py. """
+    errors = DEFAULT_POLICY.errors(field.data or '')
+    if errors:
+        raise ValidationError(errors[0])
+
+def not_breached(form, field):
+    """ Rejects passwords found in the offline breached password corpus, when one is configured. """
+    corpus = get_corpus(current_app.config['BREACHED_PASSWORDS_PATH'])
+    if corpus is not None and field.data:
+        seen = corpus.count(field.data)
+        if seen:
+            raise ValidationError(f"This password has appeared in {seen} data breaches. Please choose a different one.")
+
+def valid_image(form, field):
+    """ Rejects uploads that are named like pictures but are not. """
+    if field.data and not pictures.is_image(field.data.stream):
+        raise ValidationError("That file is not a picture.")
 
 class RegistrationForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[
-        DataRequired(),
-        Length(min=6, max=20),
-        Regexp(r'^(?!.*[_,/]).*$', message="Password cannot contain _, / or ,"),  # Disallow _, /, and ,
-        Regexp(r'.*[A-Za-z].*', message="Password must contain at least one letter"),
-        Regexp(r'.*\d.*', message="Password must contain at least one number"),
-        Regexp(r'.*[\W_].*', message="Password must contain at least one special character"),  # Special character
-    ])
+    password = PasswordField('Password', validators=[DataRequired(), password_validator, not_breached])
     confirm_password = PasswordField('Confirm Password', validators=[
         DataRequired(),
         EqualTo('password', message="Passwords must match")
@@ -73,14 +69,7 @@ class AddPassword(FlaskForm):
     webaddress = StringField('Web Address', validators=[DataRequired()])
     username = StringField('Username', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[
-        DataRequired(),
-        Length(min=6, max=20),
-        Regexp(r'^(?!.*[_,/]).*$', message="Password cannot contain _, / or ,"),
-        Regexp(r'.*[A-Za-z].*', message="Password must contain at least one letter"),
-        Regexp(r'.*\d.*', message="Password must contain at least one number"),
-        Regexp(r'.*[\W_].*', message="Password must contain at least one special character"),
-    ])
+    password = PasswordField('Password', validators=[DataRequired(), password_validator, not_breached])
 
     submit_btn = SubmitField('Submit')
 
@@ -95,7 +84,7 @@ class RequestResetForm(FlaskForm):
             raise ValidationError('There is no account with this email. You must register first.')
 
 class ResetPasswordForm(FlaskForm):
-    password = PasswordField('Password', validators=[DataRequired(), password_validator])
+    password = PasswordField('Password', validators=[DataRequired(), password_validator, not_breached])
     confirm_password = PasswordField('Confirm password', validators=[DataRequired(), EqualTo('password')])
 
     submit_btn = SubmitField('Reset Password')
@@ -104,7 +93,7 @@ class ResetPasswordForm(FlaskForm):
 class UserAccountUpdate(FlaskForm):    
     name = StringField('Name', validators=[DataRequired(), Length(min=2, max=20)])
     email = StringField('Email', validators=[DataRequired(), Email()])
-    picture = FileField('Update Profile Picture', validators=[FileAllowed(['jpg', 'png'])])
+    picture = FileField('Update Profile Picture', validators=[FileAllowed(['jpg', 'png']), valid_image])
     submit_btn = SubmitField('Update')
 
     # Adding validation for abnormal anomalies
@@ -118,25 +107,5 @@ class UpdatePassword(FlaskForm):
     webaddress = StringField('Website Address', validators=[DataRequired()])
     username = StringField('Username', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[
-        DataRequired(),
-        Length(min=6, max=20),
-        Regexp(r'^(?!.*[_,/]).*$', message="Password cannot contain _, / or ,"),
-        Regexp(r'.*[A-Za-z].*', message="Password must contain at least one letter"),
-        Regexp(r'.*\d.*', message="Password must contain at least one number"),
-        Regexp(r'.*[\W_].*', message="Password must contain at least one special character"),
-    ])
+    password = PasswordField('Password', validators=[DataRequired(), password_validator, not_breached])
     submit_btn = SubmitField('Update Password')
-
-# forms.py (no changes necessary for the generator, but you might adjust if needed)
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, IntegerField
-from wtforms.validators import DataRequired, Length, Email
-
-# Example form for password management
-class AddPassword(FlaskForm):
-    webaddress = StringField('Web Address', validators=[DataRequired()])
-    username = StringField('Username', validators=[DataRequired()])
-    email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[DataRequired()])
-    submit_btn = SubmitField('Add Password')
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt as _bcrypt
+from flask import current_app
+from loginapp.metrics import timer
+
+
+class HashPoolFull(Exception):
+    """ Raised when the hashing queue is full, a hash times out or the pool broke. Turned into a 503 by the error handler below. """
+
+
+# These run inside the worker processes, so they only use the bcrypt library and hashlib
+def _hash(password, rounds):
+    return _bcrypt.hashpw(password.encode('utf-8'), _bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _verify(pw_hash, password, rounds):
+    """ Returns (matches, new_hash). new_hash is set when the stored hash used a different cost. """
+    if not _bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8')):
+        return False, None
+    if hash_rounds(pw_hash) != rounds:
+        return True, _hash(password, rounds)
+    return True, None
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs about 128 * n * r bytes, OpenSSL refuses anything above maxmem
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+def hash_rounds(pw_hash):
+    """ Cost factor of a stored hash, e.g. 12 for '$2b$12$...'. """
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+_pool = None
+_slots = None
+_lock = threading.Lock()
+
+def _get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(current_app.config['HASH_QUEUE_SIZE'])
+                _pool = ProcessPoolExecutor(max_workers=current_app.config['HASH_POOL_SIZE'])
+    return _pool
+
+def _discard_pool(pool):
+    """ Forget a broken pool (a worker died, e.g. killed for memory), the next call starts a new one. """
+    global _pool, _slots
+    with _lock:
+        if _pool is pool:
+            _pool = None
+            _slots = None
+    pool.shutdown(wait=False)
+
+def shutdown_pool():
+    """ Stop the workers. The next hash call starts a new pool using the current config. """
+    global _pool, _slots
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+        _slots = None
+
+def _run(fn, *args):
+    if current_app.config['HASH_POOL_SIZE'] == 0:
+        return fn(*args)
+    pool = _get_pool()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashPoolFull()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _discard_pool(pool)
+        raise HashPoolFull()
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config['HASH_TIMEOUT'])
+    except TimeoutError:
+        # the hash keeps its slot until it finishes, so a stuck pool fills up and answers 503 at once
+        raise HashPoolFull()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise HashPoolFull()
+
+
+def generate_password_hash(password):
+    with timer('bcrypt_hash'):
+        return _run(_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+def check_password_hash(pw_hash, password):
+    """ Returns (matches, new_hash) -- store new_hash when it is not None. """
+    with timer('bcrypt_verify'):
+        return _run(_verify, pw_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+def derive_key(password, salt, n, r, p):
+    """ 32 byte scrypt key from a login password, used to wrap the vault key (see encryption.py). """
+    with timer('vault_kdf'):
+        return _run(_scrypt, password, salt, n, r, p)
+
+
+def hash_pool_full(error):
+    return "Server is busy, please try again shortly.", 503, {'Retry-After': '1'}
+
+def init_app(app):
+    app.register_error_handler(HashPoolFull, hash_pool_full)
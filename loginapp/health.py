@@ -0,0 +1,104 @@
+"""
+Vault health: strength scores and reuse detection for a user's saved passwords.
+
+Each PasswordManager row caches its strength and two keyed fingerprints, set
+whenever the password is assigned (see PasswordManager.set_password).
+Fingerprints are keyed per user with a subkey of their vault key, so they
+only compare rows within one vault and a copy of the database gives nothing
+to run a dictionary against without unlocking that vault.
+The report groups rows by fingerprint in a dict, so it is O(n) in vault size.
+"""
+import hashlib
+import hmac
+import math
+
+WEAK_BITS = 50
+FAIR_BITS = 70
+
+# common substitutions undone before comparing passwords for near-duplicates
+LEET = str.maketrans({'0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's', '!': 'i'})
+
+
+def password_strength(password):
+    """ Estimated entropy in bits: character pool size per character, repeated characters count less. """
+    if not password:
+        return 0.0
+    pool = 0
+    if any(c.islower() for c in password):
+        pool += 26
+    if any(c.isupper() for c in password):
+        pool += 26
+    if any(c.isdigit() for c in password):
+        pool += 10
+    if any(not c.isalnum() for c in password):
+        pool += 33
+    distinct = len(set(password))
+    return round(math.log2(pool) * (distinct + (len(password) - distinct) * 0.25), 1)
+
+
+# Fingerprints from fingerprint_key() start with this (never a hex digit); older ones were keyed with SECRET_KEY
+KEYED = 'k'
+
+def fingerprint_key(vault_key, owner_id):
+    return hmac.new(vault_key, f'fingerprint:{owner_id}'.encode('ascii'), hashlib.sha256).digest()
+
+def _fingerprint(key, value):
+    # 64 characters, the size of the columns
+    return KEYED + hmac.new(key, value.encode('utf-8'), hashlib.sha256).hexdigest()[:63]
+
+def fingerprint(password, key):
+    return _fingerprint(key, password)
+
+def skeleton(password):
+    """ The password with case, leetspeak and leading/trailing digits and symbols removed. """
+    core = password.lower()
+    core = core.strip('0123456789!@#$%^&*()+={}[]:;"\'<>.?\\|`~-') or core
+    return core.translate(LEET)
+
+def skeleton_fingerprint(password, key):
+    return _fingerprint(key, 'skeleton:' + skeleton(password))
+
+
+def health_columns(password, key):
+    """ Values for the cached health columns of a PasswordManager row. key: the owner's fingerprint_key(). """
+    return {
+        'strength': password_strength(password),
+        'fingerprint': fingerprint(password, key),
+        'skeleton': skeleton_fingerprint(password, key),
+    }
+
+
+def rating(bits):
+    if bits < WEAK_BITS:
+        return 'weak'
+    if bits < FAIR_BITS:
+        return 'fair'
+    return 'strong'
+
+
+def build_report(rows):
+    """
+    rows: iterable of objects with sl, webaddress, username, strength, fingerprint and skeleton.
+    Returns weak rows, groups of reused passwords and groups of near-duplicate passwords.
+    """
+    weak = []
+    by_fingerprint = {}
+    by_skeleton = {}
+    total = 0
+    for row in rows:
+        total += 1
+        if row.strength < WEAK_BITS:
+            weak.append(row)
+        by_fingerprint.setdefault(row.fingerprint, []).append(row)
+        by_skeleton.setdefault(row.skeleton, []).append(row)
+
+    reused = [group for group in by_fingerprint.values() if len(group) > 1]
+    # near-duplicates: same skeleton but not all the very same password
+    similar = [group for group in by_skeleton.values()
+               if len(group) > 1 and len({row.fingerprint for row in group}) > 1]
+    return {
+        'total': total,
+        'weak': sorted(weak, key=lambda row: row.strength),
+        'reused': sorted(reused, key=len, reverse=True),
+        'similar': sorted(similar, key=len, reverse=True),
+    }
@@ -0,0 +1,199 @@
+"""
+Request, SQL and background work metrics, served on /metrics in the
+Prometheus text format.
+
+Metrics live in this process only; with several worker processes each one
+reports its own numbers.
+
+A request is recorded when its response is closed, so a streamed page counts
+the time and SQL of generating its body. With METRICS_ENABLED off neither
+requests nor SQL statements are timed.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger('loginapp.slow_query')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # per bucket counts (last one is +Inf), sum
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        names = self.label_names + ('le',)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+request_latency = Histogram('http_request_duration_seconds', 'Time until the response body has been sent.', ('endpoint', 'method', 'status'))
+request_queries = Histogram('http_request_sql_queries', 'SQL queries run per request.', ('endpoint',), COUNT_BUCKETS)
+request_query_time = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',))
+query_latency = Histogram('sql_query_duration_seconds', 'Time of single SQL statements.')
+slow_queries = Counter('sql_slow_queries_total', 'Statements slower than SLOW_QUERY_THRESHOLD.')
+operation_latency = Histogram('operation_duration_seconds', 'Time of bcrypt, mail and image work.', ('operation',))
+throttled_requests = Counter('throttled_requests_total', 'Login and reset attempts rejected before hashing.', ('limit',))
+
+METRICS = [request_latency, request_queries, request_query_time, query_latency, slow_queries, operation_latency, throttled_requests]
+
+# functions returning [(name, type, help, value)] for values read at scrape time
+GAUGES = []
+
+def gauge(fn):
+    GAUGES.append(fn)
+    return fn
+
+
+@contextmanager
+def timer(operation):
+    """ with timer('bcrypt_hash'): ... records into operation_duration_seconds. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_latency.observe(time.perf_counter() - start, operation)
+
+
+def start_request_timer():
+    if current_app.config['METRICS_ENABLED']:
+        g.metrics_start = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+
+def record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        # streamed bodies are generated after this returns; the SQL they run still lands in this g
+        request_g = g._get_current_object()
+        labels = (request.endpoint or 'unknown', request.method, response.status_code)
+        response.call_on_close(lambda: _observe_request(start, request_g, *labels))
+    return response
+
+def _observe_request(start, request_g, endpoint, method, status):
+    request_latency.observe(time.perf_counter() - start, endpoint, method, status)
+    request_queries.observe(request_g.get('sql_queries', 0), endpoint)
+    request_query_time.observe(request_g.get('sql_time', 0.0), endpoint)
+
+
+def _sql_metrics_enabled():
+    return has_app_context() and current_app.config['METRICS_ENABLED']
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sql_metrics_enabled():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    query_latency.observe(elapsed)
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_time += elapsed
+    threshold = current_app.config['SLOW_QUERY_THRESHOLD']
+    if elapsed >= threshold:
+        slow_queries.inc()
+        slow_query_log.warning("slow query (%.1f ms): %s", elapsed * 1000, ' '.join(statement.split()))
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for fn in GAUGES:
+        for name, kind, help, value in fn():
+            lines.extend((f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}'))
+    return '\n'.join(lines) + '\n'
+
+
+@gauge
+def user_cache_metrics():
+    from loginapp.models import user_cache
+    stats = user_cache.stats()
+    return [
+        ('user_cache_hits_total', 'counter', 'user_loader cache hits.', stats['hits']),
+        ('user_cache_misses_total', 'counter', 'user_loader cache misses.', stats['misses']),
+        ('user_cache_evictions_total', 'counter', 'user_loader cache evictions.', stats['evictions']),
+        ('user_cache_size', 'gauge', 'Users currently cached.', stats['size']),
+    ]
+
+@gauge
+def outbox_metrics():
+    from loginapp.outbox import outbox
+    return [
+        ('mail_outbox_depth', 'gauge', 'Emails waiting to be sent.', outbox.depth()),
+        ('mail_sent_total', 'counter', 'Emails sent by this process.', outbox.sent),
+        ('mail_failed_total', 'counter', 'Emails given up on by this process.', outbox.failed),
+    ]
+
+
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if app.config['METRICS_ENABLED'] and not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -1,7 +1,17 @@
-from sqlalchemy.orm import backref
+from datetime import datetime
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import backref, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from itsdangerous import URLSafeTimedSerializer as Serializer
-from loginapp import db, login_manager, app
+from flask import current_app
+from loginapp import db, login_manager
 from flask_login import UserMixin # this line is also important dono why
+from loginapp.cache import TTLCache
+from loginapp.health import health_columns
+
+# Column values of recently loaded users, keyed by id. Saves a query per request in load_user().
+# Call user_cache.invalidate(user.id) whenever a user row is changed. Sized by create_app().
+user_cache = TTLCache()
 
 
 # below is the login manager loader 
@@ -9,7 +19,22 @@ from flask_login import UserMixin # this line is also important dono why
 # There in documentation @ https://flask-login.readthedocs.io/en/latest/
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    key = identity_key(User, user_id)
+    if key in db.session.identity_map:
+        return db.session.identity_map[key]
+    values = user_cache.get(user_id)
+    if values is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            user_cache.set(user_id, {column: getattr(user, column) for column in CACHED_USER_COLUMNS})
+        return user
+    # rebuild the user from the cache and attach it to this session without a query.
+    # The credential columns are left out, so they are loaded from the database when login or reset reads them.
+    user = User(**values)
+    make_transient_to_detached(user)
+    db.session.add(user)
+    return user
 
 class User(db.Model, UserMixin):
     __tablename__ = 'user'
@@ -18,17 +43,23 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique = True, nullable = False)
     image_file = db.Column(db.String(20), nullable = False, default = 'default.jpg')
     password = db.Column(db.String(60), nullable = False)
+    # bumped by every change to the user's vault, see next_vault_version(). NULL means 0.
+    # Read it with a query, the cached copy in user_cache goes stale on every change.
+    vault_version = db.Column(db.Integer, default = 0)
+    # the key encrypting this user's passwords, wrapped by encryption.py; NULL until the first login
+    vault_key = db.Column(db.Text)
+    vault_recovery = db.Column(db.Text)
     
     passwords = db.relationship('PasswordManager', backref='owner') # adding realtionship bertween user table and password manager table.
 
     # To reset password
     def get_reset_token(self, expires_sec=1800):
-        s = Serializer(app.config['SECRET_KEY'], expires_sec)
+        s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
         return s.dumps({'user_id': self.id}).decode('utf-8')
 
     @staticmethod
     def verify_reset_token(token):
-        s = Serializer(app.config['SECRET_KEY'])
+        s = Serializer(current_app.config['SECRET_KEY'])
         try:
             user_id = s.loads(token)['user_id']
         except:
@@ -38,16 +69,107 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f"User {self.name}, {self.email}, {self.password} " 
 
+# everything load_user() needs for a page; never the password hash or wrapped vault keys, which another worker may have changed
+CACHED_USER_COLUMNS = [column for column in User.__table__.columns.keys() if column not in ('password', 'vault_key', 'vault_recovery')]
+
 class PasswordManager(db.Model):
     __tablename__ = 'password_manager'
+    # display() pages through a user's rows with "owner_id = ? AND sl > ? ORDER BY sl"
+    # /api/vault?since= reads "owner_id = ? AND version > ?"
+    __table_args__ = (db.Index('ix_password_manager_owner_sl', 'owner_id', 'sl'),
+                      db.Index('ix_password_manager_owner_version', 'owner_id', 'version'))
     sl = db.Column(db.Integer, primary_key = True)
     webaddress = db.Column(db.String(100), nullable = False)
     username = db.Column(db.String(50), nullable = False)
     email = db.Column(db.String(120), nullable = False)
-    password = db.Column(db.String(60), nullable = False)
+    password = db.Column(db.Text, nullable = False) # encrypted, see set_password()
+    # cached by set_password() for the vault health report, computed from the plaintext
+    strength = db.Column(db.Float)
+    fingerprint = db.Column(db.String(64))
+    skeleton = db.Column(db.String(64))
+    # vault_version of the owner when the row was last changed, set by stamp_vault_changes()
+    version = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime)
 
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
+    def set_password(self, password, cipher):
+        """ Store `password` encrypted with the owner's encryption.Cipher and refresh the health columns. """
+        for column, value in health_columns(password, cipher.fingerprint_key).items():
+            setattr(self, column, value)
+        self.password = cipher.encrypt(password)
+
     def __repr__(self):
         return f"User {self.sl}: {self.webaddress}, {self.username}, {self.email}, {self.password} "
 
+
+class PasswordTombstone(db.Model):
+    """ Left behind by a deleted PasswordManager row so /api/vault?since= can report the deletion """
+    __tablename__ = 'password_tombstone'
+    __table_args__ = (db.Index('ix_password_tombstone_owner_version', 'owner_id', 'version'),)
+    sl = db.Column(db.Integer, primary_key = True) # sl of the deleted row
+    owner_id = db.Column(db.Integer, nullable = False)
+    version = db.Column(db.Integer, nullable = False)
+    deleted_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+    def __repr__(self):
+        return f"Tombstone {self.sl} of user {self.owner_id} at version {self.version}"
+
+
+# columns a sync client sees; changes to the cached health columns alone are not a new version
+SYNCED_COLUMNS = ('webaddress', 'username', 'email', 'password', 'owner_id')
+
+def next_vault_version(session, owner_id):
+    """
+    Increment and return the owner's vault_version inside the current transaction.
+    The UPDATE takes SQLite's write lock, so concurrent writers get distinct versions.
+    """
+    session.execute(update(User.__table__).where(User.__table__.c.id == owner_id)
+                    .values(vault_version=func.coalesce(User.__table__.c.vault_version, 0) + 1))
+    return session.execute(select(User.__table__.c.vault_version).where(User.__table__.c.id == owner_id)).scalar()
+
+@event.listens_for(db.session, 'before_flush')
+def stamp_vault_changes(session, flush_context, instances):
+    """
+    Give every added, changed or deleted PasswordManager row its owner's next version.
+    Bulk inserts that bypass the ORM (import_passwords) call next_vault_version() themselves.
+    """
+    changed, deleted = {}, {}
+    for field in session.new:
+        if isinstance(field, PasswordManager):
+            owner_id = field.owner_id if field.owner_id is not None else getattr(field.owner, 'id', None)
+            changed.setdefault(owner_id, []).append(field)
+    for field in session.dirty:
+        if isinstance(field, PasswordManager) and any(inspect(field).attrs[column].history.has_changes() for column in SYNCED_COLUMNS):
+            changed.setdefault(field.owner_id, []).append(field)
+    for field in session.deleted:
+        if isinstance(field, PasswordManager):
+            deleted.setdefault(field.owner_id, []).append(field)
+    now = datetime.utcnow()
+    for owner_id in (changed.keys() | deleted.keys()) - {None}:
+        version = next_vault_version(session, owner_id)
+        for field in changed.get(owner_id, ()):
+            field.version = version
+            field.updated_at = now
+        for field in deleted.get(owner_id, ()):
+            session.merge(PasswordTombstone(sl=field.sl, owner_id=owner_id, version=version, deleted_at=now))
+
+
+class OutboxMessage(db.Model):
+    """ Email waiting to be sent by the background sender in outbox.py """
+    __tablename__ = 'outbox_message'
+    id = db.Column(db.Integer, primary_key = True)
+    subject = db.Column(db.String(200), nullable = False)
+    sender = db.Column(db.String(120))
+    recipients = db.Column(db.Text, nullable = False) # comma separated
+    body = db.Column(db.Text, nullable = False)
+    created_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable = False, default = 0)
+    next_attempt_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, index = True)
+    lease_until = db.Column(db.DateTime) # set while a sender is working on the message
+    sent_at = db.Column(db.DateTime, index = True)
+    failed = db.Column(db.Boolean, nullable = False, default = False)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f"Outbox {self.id}: {self.subject} to {self.recipients}, attempts {self.attempts}"
@@ -0,0 +1,151 @@
+"""
+Outbox for outgoing email.
+
+Routes call `outbox.enqueue(...)`, which only writes a row to the outbox_message
+table. A background thread picks up due messages in batches, sends each batch
+over a single SMTP connection and retries failures with exponential backoff.
+
+To try it locally without a real mail server:
+
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=0 python run.py
+"""
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from loginapp import db
+from loginapp.models import OutboxMessage
+from loginapp.metrics import timer
+
+
+def _connect():
+    """ An SMTP connection. Flask-Mail is only imported and set up when the first email goes out. """
+    from flask_mail import Mail
+    app = current_app._get_current_object()
+    if 'mail' not in app.extensions:
+        Mail(app)
+    return app.extensions['mail'].connect()
+
+
+class Outbox:
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def enqueue(self, subject, recipients, body, sender=None):
+        message = OutboxMessage(subject=subject, sender=sender, recipients=','.join(recipients), body=body)
+        db.session.add(message)
+        db.session.commit()
+        self.start(current_app._get_current_object())
+        self.wakeup.set()
+        return message
+
+    def depth(self):
+        """ Number of messages still waiting to be sent (including ones backing off). """
+        return OutboxMessage.query.filter(OutboxMessage.sent_at.is_(None), OutboxMessage.failed.is_(False)).count()
+
+    def start(self, app):
+        with self.lock:
+            self.app = app
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self._run, name='mail-outbox', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def flush(self):
+        """ Send everything that is due right now, on the calling thread. Returns the number sent. """
+        total = 0
+        while True:
+            sent, claimed = self._send_batch()
+            total += sent
+            if claimed < current_app.config['MAIL_OUTBOX_BATCH']:
+                return total
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                self.app.logger.exception('mail outbox flush failed')
+            self.wakeup.wait(self.app.config['MAIL_OUTBOX_POLL'])
+            self.wakeup.clear()
+
+    def _claim(self, now):
+        """ Lease a batch of due messages so other workers leave them alone. """
+        lease_until = now + timedelta(seconds=current_app.config['MAIL_OUTBOX_LEASE'])
+        candidates = (OutboxMessage.query
+                      .filter(OutboxMessage.sent_at.is_(None), OutboxMessage.failed.is_(False),
+                              OutboxMessage.next_attempt_at <= now,
+                              or_(OutboxMessage.lease_until.is_(None), OutboxMessage.lease_until < now))
+                      .order_by(OutboxMessage.next_attempt_at)
+                      .limit(current_app.config['MAIL_OUTBOX_BATCH'])
+                      .with_entities(OutboxMessage.id)
+                      .all())
+        claimed = []
+        for (message_id,) in candidates:
+            updated = (OutboxMessage.query
+                       .filter(OutboxMessage.id == message_id,
+                               or_(OutboxMessage.lease_until.is_(None), OutboxMessage.lease_until < now))
+                       .update({'lease_until': lease_until}, synchronize_session=False))
+            if updated:
+                claimed.append(message_id)
+        db.session.commit()
+        return OutboxMessage.query.filter(OutboxMessage.id.in_(claimed)).all() if claimed else []
+
+    def _send_batch(self):
+        from flask_mail import Message
+        messages = self._claim(datetime.utcnow())
+        if not messages:
+            return 0, 0
+        sent = 0
+        try:
+            # one SMTP connection for the whole batch
+            with _connect() as connection:
+                for message in messages:
+                    try:
+                        with timer('mail_send'):
+                            connection.send(Message(message.subject, sender=message.sender,
+                                                    recipients=message.recipients.split(','), body=message.body))
+                    except Exception as e:
+                        self._retry_later(message, e)
+                    else:
+                        message.sent_at = datetime.utcnow()
+                        message.lease_until = None
+                        sent += 1
+        except Exception as e:
+            # could not connect (or the connection dropped): back off everything not yet sent
+            for message in messages:
+                if message.sent_at is None and message.lease_until is not None:
+                    self._retry_later(message, e)
+        db.session.commit()
+        self.sent += sent
+        return sent, len(messages)
+
+    def _retry_later(self, message, error):
+        message.attempts += 1
+        message.last_error = str(error)
+        message.lease_until = None
+        if message.attempts >= current_app.config['MAIL_OUTBOX_MAX_ATTEMPTS']:
+            message.failed = True
+            self.failed += 1
+            current_app.logger.error('giving up on email %s after %s attempts: %s', message.id, message.attempts, error)
+            return
+        delay = min(current_app.config['MAIL_OUTBOX_BACKOFF'] * 2 ** (message.attempts - 1), current_app.config['MAIL_OUTBOX_MAX_BACKOFF'])
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+
+outbox = Outbox()
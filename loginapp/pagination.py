@@ -0,0 +1,35 @@
+from flask import Response, current_app, stream_with_context
+
+
+class KeysetPage:
+    """
+    One page of a keyset (cursor) paginated query.
+    Rows are pulled from the database lazily while the template iterates,
+    so the page can be streamed to the browser as it is rendered.
+    `next_after` is only known once the rows have been consumed.
+    """
+    def __init__(self, query, key, after=None, size=100):
+        if after is not None:
+            query = query.filter(key > after)
+        # one extra row tells us whether there is a next page
+        self.query = query.order_by(key).limit(size + 1)
+        self.key_name = key.key
+        self.size = size
+        self.after = after
+        self.next_after = None
+
+    def __iter__(self):
+        last = None
+        for count, row in enumerate(self.query.yield_per(self.size), start=1):
+            if count > self.size:
+                self.next_after = last
+                break
+            last = getattr(row, self.key_name)
+            yield row
+
+
+def stream_template(template_name, **context):
+    """ Render a template as a streamed response (Flask 2.0 has no flask.stream_template). """
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
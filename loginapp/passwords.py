@@ -0,0 +1,123 @@
+"""
+Password policy shared by the forms and the password generator.
+
+The generator draws bytes from os.urandom in bulk and maps them onto the
+allowed alphabet by rejection (bytes that would cause modulo bias are
+dropped), so every character is uniform over its alphabet. Passwords meet the
+policy by construction: one character from each required class is placed at a
+random position, and the rest come from the full alphabet.
+"""
+import os
+import string
+
+LETTERS = string.ascii_letters
+DIGITS = string.digits
+# what the generator uses for "special", anything that is not a letter or digit counts when validating
+SPECIALS = '!@#$%^&*()+={}[]:;"\'<>.?\\|`~'
+
+
+class PasswordPolicy:
+    """ Letters are always required; require_numbers / require_special add digits and special characters. """
+    def __init__(self, min_length=6, max_length=20, forbidden='_/,', require_numbers=True, require_special=True):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.forbidden = forbidden
+        self.require_numbers = require_numbers
+        self.require_special = require_special
+
+    def errors(self, password):
+        """ Messages for every rule the password breaks, empty if it is fine. """
+        errors = []
+        if len(password) < self.min_length or len(password) > self.max_length:
+            errors.append(f"Password must be between {self.min_length} and {self.max_length} characters.")
+        if not any(c in LETTERS for c in password):
+            errors.append("Password must contain at least one letter.")
+        if self.require_numbers and not any(c in DIGITS for c in password):
+            errors.append("Password must contain at least one number.")
+        if self.require_special and not any(not c.isalnum() for c in password):
+            errors.append("Password must contain at least one special character.")
+        if any(c in self.forbidden for c in password):
+            forbidden = ', '.join(f"'{c}'" for c in self.forbidden)
+            errors.append(f"Password cannot contain {forbidden}.")
+        return errors
+
+    def clamp_length(self, length):
+        return max(self.min_length, min(length, self.max_length))
+
+    def classes(self, include_numbers=False, include_special=False):
+        """
+        Character classes a generated password draws from, each of them used at least once.
+        Classes the policy requires are always in, so generated passwords pass errors().
+        """
+        classes = [LETTERS]
+        if include_numbers or self.require_numbers:
+            classes.append(DIGITS)
+        if include_special or self.require_special:
+            classes.append(SPECIALS)
+        return [''.join(c for c in chars if c not in self.forbidden) for chars in classes]
+
+
+DEFAULT_POLICY = PasswordPolicy()
+
+
+class RandomBytes:
+    """ Buffered os.urandom with unbiased helpers for picking characters and indexes. """
+    def __init__(self, buffer_size=4096):
+        self.buffer_size = buffer_size
+        self.buffer = b''
+        self.pos = 0
+        self.tables = {}
+
+    def _take(self, n):
+        if self.pos + n > len(self.buffer):
+            self.buffer = self.buffer[self.pos:] + os.urandom(max(self.buffer_size, n))
+            self.pos = 0
+        data = self.buffer[self.pos:self.pos + n]
+        self.pos += n
+        return data
+
+    def _table(self, alphabet):
+        """ bytes.translate table mapping accepted bytes onto the alphabet, plus the bytes to drop. """
+        if alphabet not in self.tables:
+            size = len(alphabet)
+            limit = 256 - 256 % size
+            table = bytes(ord(alphabet[b % size]) for b in range(limit)) + bytes(256 - limit)
+            self.tables[alphabet] = (table, bytes(range(limit, 256)))
+        return self.tables[alphabet]
+
+    def chars(self, alphabet, n):
+        """ n characters, each uniform over alphabet (ASCII, at most 256 characters). """
+        table, reject = self._table(alphabet)
+        out = b''
+        while len(out) < n:
+            # ask for a little extra to cover rejected bytes
+            need = n - len(out)
+            out += self._take(need + need // 4 + 8).translate(table, reject)
+        return out[:n].decode('ascii')
+
+    def below(self, n):
+        """ Uniform integer in [0, n) for 0 < n <= 256. """
+        limit = 256 - 256 % n
+        while True:
+            b = self._take(1)[0]
+            if b < limit:
+                return b % n
+
+
+def generate_passwords(count, length, classes, source=None):
+    """ `count` passwords of `length` characters, containing at least one character of each class. """
+    source = source or RandomBytes(buffer_size=max(4096, count * length * 2))
+    alphabet = ''.join(classes)
+    required = [source.chars(chars, count) for chars in classes]
+    rest_length = length - len(classes)
+    rest = source.chars(alphabet, count * rest_length)
+    passwords = []
+    for i in range(count):
+        chars = [column[i] for column in required]
+        chars.extend(rest[i * rest_length:(i + 1) * rest_length])
+        # Fisher-Yates shuffle so the required characters land anywhere
+        for j in range(length - 1, 0, -1):
+            k = source.below(j + 1)
+            chars[j], chars[k] = chars[k], chars[j]
+        passwords.append(''.join(chars))
+    return passwords
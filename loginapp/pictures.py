@@ -0,0 +1,170 @@
+"""
+Profile pictures.
+
+Uploads are streamed to disk while being hashed and named after their content,
+so the same picture uploaded twice is stored once. Resizing happens on a
+background thread: the upload is decoded once with Pillow's draft() (JPEGs are
+decoded at a reduced scale) and saved in each size of AVATAR_SIZES. Pictures
+nobody uses any more are deleted.
+
+User.image_file holds '<hash>.jpg'; the renditions are '<hash>-<size>.jpg'.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app
+from loginapp.metrics import timer
+
+DEFAULT_PICTURE = 'default.jpg'
+ORPHAN_AGE = 60 # seconds after which an original nobody resized is picked up by another process
+HASH_LENGTH = 16 # hex characters, keeps '<hash>.jpg' inside User.image_file's 20 characters
+
+log = logging.getLogger('loginapp.pictures')
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pictures')
+_pending = {}
+_lock = threading.Lock()
+
+
+def picture_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'profile_pics')
+
+def _original_path(name):
+    return os.path.join(picture_dir(), 'originals', name)
+
+def rendition_name(image_file, size):
+    base, _ = os.path.splitext(image_file)
+    return f'{base}-{size}.jpg'
+
+def _rendition_path(image_file, size):
+    return os.path.join(picture_dir(), rendition_name(image_file, size))
+
+
+def is_image(stream):
+    """ Whether Pillow can read the upload. Leaves the stream at the start. """
+    from PIL import Image
+    try:
+        with Image.open(stream) as image:
+            image.verify()
+        return True
+    except Exception:
+        return False
+    finally:
+        stream.seek(0)
+
+
+def save_picture(form_picture):
+    """ Store an upload and queue its renditions. Returns the new value for User.image_file. """
+    os.makedirs(os.path.join(picture_dir(), 'originals'), exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.join(picture_dir(), 'originals'))
+    with os.fdopen(fd, 'wb') as tmp:
+        for chunk in iter(lambda: form_picture.stream.read(64 * 1024), b''):
+            digest.update(chunk)
+            tmp.write(chunk)
+    image_file = digest.hexdigest()[:HASH_LENGTH] + '.jpg'
+    sizes = current_app.config['AVATAR_SIZES']
+
+    if all(os.path.exists(_rendition_path(image_file, size)) for size in sizes):
+        # someone already uploaded this picture
+        os.remove(tmp_path)
+        return image_file
+    os.replace(tmp_path, _original_path(image_file))
+    _queue(image_file, sizes)
+    return image_file
+
+
+def _queue(image_file, sizes):
+    with _lock:
+        if image_file not in _pending:
+            _pending[image_file] = _executor.submit(make_renditions, image_file, sizes)
+
+
+def make_renditions(image_file, sizes):
+    """
+    Resize the original into every size, then delete it. Another worker process may be
+    doing the same picture at the same time: temp files are unique, finished renditions
+    are never deleted, and a missing original means the other one got there first.
+    """
+    from PIL import Image # only needed by the worker
+    sizes = sorted(sizes, reverse=True)
+    original = _original_path(image_file)
+    tmp_path = None
+    try:
+        with timer('image_renditions'), Image.open(original) as image:
+            # lets the JPEG decoder skip straight to a scale close to the largest size we need
+            image.draft('RGB', (sizes[0], sizes[0]))
+            image = image.convert('RGB')
+            for size in sizes:
+                image.thumbnail((size, size))
+                fd, tmp_path = tempfile.mkstemp(dir=picture_dir(), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as tmp:
+                    image.save(tmp, 'JPEG', quality=85, optimize=True)
+                os.replace(tmp_path, _rendition_path(image_file, size))
+                tmp_path = None
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # a broken upload: dropped with the original below, avatar() then shows the default picture
+        log.exception('could not resize picture %s', image_file)
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.remove(original)
+        except FileNotFoundError:
+            pass
+        with _lock:
+            _pending.pop(image_file, None)
+
+
+def wait_for_renditions(image_file, timeout=10):
+    """
+    Wait for an upload queued in this process to be resized (used when its renditions are requested early).
+    Never resizes on the calling thread. Returns False while the picture is still being resized elsewhere.
+    """
+    with _lock:
+        future = _pending.get(image_file)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            return False
+        return True
+    try:
+        age = time.time() - os.path.getmtime(_original_path(image_file))
+    except FileNotFoundError:
+        return True
+    if age > ORPHAN_AGE:
+        # the process that took the upload died before resizing it
+        _queue(image_file, current_app.config['AVATAR_SIZES'])
+    return False
+
+
+def collect_garbage(image_file, in_use):
+    """ Delete a picture's files unless `in_use(image_file)` says someone still uses it. Runs in the background. """
+    if image_file == DEFAULT_PICTURE or '/' in image_file:
+        return
+    app = current_app._get_current_object()
+
+    def collect():
+        with app.app_context():
+            if in_use(image_file):
+                return
+        with _lock:
+            if image_file in _pending:
+                return
+        # the plain name covers pictures saved before renditions existed
+        paths = [os.path.join(picture_dir(), image_file), _original_path(image_file)]
+        paths += [_rendition_path(image_file, size) for size in app.config['AVATAR_SIZES']]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    _executor.submit(collect)
@@ -1,35 +1,35 @@
+import csv
 import os
-from os import urandom
-import random
-import sqlite3
-import string
-from PIL import Image
-from flask import jsonify, render_template, flash, redirect, url_for, request
-from loginapp import app, db, bcrypt, mail
+from datetime import datetime
+from flask import Blueprint, abort, current_app, jsonify, make_response, render_template, flash, redirect, url_for, request, Response, stream_with_context, send_from_directory
+from werkzeug.datastructures import MultiDict
+from sqlalchemy.orm import load_only
+from loginapp import db
+from loginapp import hashing
 from loginapp.forms import RegistrationForm, LoginForm, AddPassword, RequestResetForm, ResetPasswordForm, UserAccountUpdate, UpdatePassword
-from loginapp.models import User, PasswordManager
+from loginapp.models import User, PasswordManager, user_cache, next_vault_version
+from loginapp.pagination import KeysetPage, stream_template
+from loginapp.extdb import get_writer
+from loginapp.outbox import outbox
+from loginapp.search import prefix_search, fuzzy_search
+from loginapp import transfer
+from loginapp.passwords import DEFAULT_POLICY, generate_passwords
+from loginapp.health import build_report, health_columns, rating
+from loginapp.breach import get_corpus
+from loginapp import pictures
+from loginapp import vault
+from loginapp import encryption
+from loginapp import throttle
+from cryptography.exceptions import InvalidTag
 from flask_login import login_user, current_user, logout_user, login_required
-from flask_mail import Message
-
-def init_db():
-    conn = sqlite3.connect('ext.db')
-    cursor = conn.cursor()
-    # Create the credentials table if it does not exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS credentials (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            web_url TEXT NOT NULL,
-            password TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# Initialize the database when the server starts
-init_db()
-
-
-@app.route('/generate_password', methods=['GET', 'POST'])
+
+main = Blueprint('main', __name__)
+
+HEALTH_SECTIONS = {'weak': 'Weak passwords', 'breached': 'Breached passwords',
+                   'reused': 'Reused passwords', 'similar': 'Similar passwords'}
+
+
+@main.route('/generate_password', methods=['GET', 'POST'])
 @login_required
 def generate_password():
     if request.method == 'POST':
@@ -40,219 +40,474 @@ def generate_password():
 
         # Generate the password based on user input
         password = generate_random_password(length, include_special, include_numbers)
-        return render_template('generate_password.html', password=password)
+        return render_template('generate_password.html', password=password, policy=DEFAULT_POLICY, length=length,
+                               include_special=include_special, include_numbers=include_numbers)
 
-    return render_template('generate_password.html', password=None)
+    return render_template('generate_password.html', password=None, policy=DEFAULT_POLICY, length=12,
+                           include_special=True, include_numbers=True)
 
 def generate_random_password(length, include_special, include_numbers):
-    # Character sets for password generation
-    characters = string.ascii_letters  # Letters (lower and uppercase)
-
-    if include_numbers:
-        characters += string.digits  # Add digits
-
-    if include_special:
-        characters += string.punctuation  # Add special characters
-
-    # Generate a random password with the given length
-    password = ''.join(random.choice(characters) for _ in range(length))
+    # Letters always, digits and special characters when asked for or required by the policy, one of each guaranteed
+    classes = DEFAULT_POLICY.classes(include_numbers=include_numbers, include_special=include_special)
+    return generate_passwords(1, DEFAULT_POLICY.clamp_length(length), classes)[0]
 
-    return password
+# Many passwords in one call, e.g. /api/generate?count=1000&length=16
+# numbers=0 / special=0 only drop a class the policy does not require
+@main.route('/api/generate')
+@login_required
+def api_generate():
+    count = max(1, min(request.args.get('count', 1, type=int), current_app.config['GENERATE_MAX_COUNT']))
+    length = DEFAULT_POLICY.clamp_length(request.args.get('length', 12, type=int))
+    classes = DEFAULT_POLICY.classes(include_numbers=request.args.get('numbers', '1') == '1',
+                                     include_special=request.args.get('special', '1') == '1')
+    return jsonify({"passwords": generate_passwords(count, length, classes)})
 
 
-@app.route('/')
+@main.route('/')
 def home():
     return render_template('home.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     page_title = 'Register'
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hashing.generate_password_hash(form.password.data)
         user = User(name=form.name.data, email=form.email.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
         flash("Account Created. Now you can login.", 'success')
         send_registration_email(user.email)
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     return render_template('register.html', title=page_title, form=form)
 
 def send_registration_email(receiver_email):
-    msg = Message('Welcome to Our App', sender=os.environ.get('MAIL_DEFAULT_SENDER'), recipients=[receiver_email])
-    msg.body = 'Thank you for registering with us!'
-    try:
-        mail.send(msg)
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    # Only queued here, the outbox sender delivers it in the background
+    outbox.enqueue('Welcome to Our App', [receiver_email], 'Thank you for registering with us!',
+                   sender=os.environ.get('MAIL_DEFAULT_SENDER'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
+    # a "remember me" login restores the user but not the vault key, so they can still log in again here
+    if current_user.is_authenticated and encryption.current_key(current_user.id) is not None:
+        return redirect(url_for('main.home'))
     page_title = 'Login'
     form = LoginForm()
     if form.validate_on_submit():
+        throttle.check('login', form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        matches, new_hash = hashing.check_password_hash(user.password, form.password.data) if user else (False, None)
+        if matches:
+            if new_hash:
+                user.password = new_hash
+            try:
+                vault_key = encryption.unlock(user, form.password.data)
+            except InvalidTag:
+                flash('Your saved passwords are locked with an earlier password and could not be unlocked.', 'danger')
+                return render_template('login.html', title=page_title, form=form)
+            encryption.encrypt_plaintext_rows(db.session, user.id, vault_key)
+            # always commit: the query above autoflushes the rehash and a new vault key, so the session looks clean here
+            db.session.commit()
+            user_cache.invalidate(user.id)
             login_user(user, remember=form.remember.data)
+            encryption.remember_key(user.id, vault_key)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('manager'))
+            return redirect(next_page) if next_page else redirect(url_for('main.manager'))
         else:
             flash('Email or password does not match.', 'danger')
     return render_template('login.html', title=page_title, form=form)
 
-@app.route('/manager')
+def vault_cipher():
+    """ Cipher for the current user's entries. Asks for the password again when the vault key is not unlocked. """
+    vault_key = encryption.current_key(current_user.id)
+    if vault_key is None:
+        if request.path.startswith('/api/'):
+            abort(make_response(jsonify({"message": "Vault is locked, log in again."}), 401))
+        flash('Please enter your password to unlock your vault.', 'info')
+        abort(redirect(url_for('main.login', next=request.full_path)))
+    return encryption.owner_cipher(vault_key, current_user.id)
+
+@main.route('/manager')
 @login_required
 def manager():
-    image_file = url_for('static', filename='profile_pics/' + current_user.image_file)
+    image_file = avatar_url(current_user.image_file)
     return render_template('manager.html', title='Manager', image_file=image_file)
 
-@app.route('/manager/add', methods=['GET', 'POST'])
+@main.route('/manager/add', methods=['GET', 'POST'])
 @login_required
 def add():
+    cipher = vault_cipher()
     form = AddPassword()
     if form.validate_on_submit():
-        name = db.session.query(User).filter_by(id=current_user.id).first()
-        field = PasswordManager(webaddress=form.webaddress.data, username=form.username.data, email=form.email.data, password=form.password.data, owner=name)
+        field = PasswordManager(webaddress=form.webaddress.data, username=form.username.data, email=form.email.data, owner_id=current_user.id)
+        field.set_password(form.password.data, cipher)
         db.session.add(field)
         db.session.commit()
-        return redirect(url_for('display'))
+        return redirect(url_for('main.display'))
     return render_template('add.html', title='Add Password', form=form)
 
-@app.route('/manager/display', methods=['GET', 'POST'])
+@main.route('/manager/display', methods=['GET', 'POST'])
 @login_required
 def display():
-    fields = db.session.query(PasswordManager).filter_by(owner_id=current_user.id).all()
-    return render_template('display.html', title='Display Passwords', elements=fields)
+    after = request.args.get('after', type=int)
+    start = request.args.get('start', 1, type=int)
+    size = request.args.get('size', current_app.config['DISPLAY_PAGE_SIZE'], type=int)
+    size = max(1, min(size, current_app.config['DISPLAY_MAX_PAGE_SIZE']))
+    # the list never decrypts, or even loads, the passwords; see reveal()
+    query = (db.session.query(PasswordManager).filter_by(owner_id=current_user.id)
+             .options(load_only(PasswordManager.sl, PasswordManager.webaddress, PasswordManager.username, PasswordManager.email)))
+    page = KeysetPage(query, PasswordManager.sl, after=after, size=size)
+    return stream_template('display.html', title='Display Passwords', elements=page, start=start)
+
+# JSON search over the current user's entries, used for autocomplete by the extension
+# ?q=<text>&mode=prefix|fuzzy&limit=<n>
+@main.route('/manager/search')
+@login_required
+def search():
+    term = request.args.get('q', '').strip()
+    mode = request.args.get('mode', 'prefix')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    if not term:
+        return jsonify({"results": []})
+    if mode == 'fuzzy':
+        results = fuzzy_search(db.session, current_user.id, term, limit)
+    else:
+        results = prefix_search(db.session, current_user.id, term, limit)
+    return jsonify({"results": results})
+
+# Bulk import of a CSV or JSON export, e.g. from a browser's password manager
+@main.route('/manager/import', methods=['POST'])
+@login_required
+def import_passwords():
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({"message": "No file uploaded."}), 400
+
+    cipher = vault_cipher()
+    chunk_size = current_app.config['IMPORT_CHUNK_SIZE']
+    max_errors = current_app.config['IMPORT_MAX_ERRORS']
+    insert = PasswordManager.__table__.insert()
+    imported, failed, errors, chunk = 0, 0, [], []
+
+    def flush():
+        if chunk:
+            # a Core insert skips stamp_vault_changes(), so version the chunk here
+            version, now = next_vault_version(db.session, current_user.id), datetime.utcnow()
+            for row in chunk:
+                row.update(version=version, updated_at=now)
+            db.session.execute(insert, chunk)
+            db.session.commit()
+            chunk.clear()
+
+    try:
+        for number, record in enumerate(transfer.iter_records(upload.stream, upload.filename), start=1):
+            row = transfer.normalise(record) if isinstance(record, dict) else {}
+            # the same rules as the add() form, without CSRF since this is not a form post per row
+            form = AddPassword(formdata=MultiDict(row), meta={'csrf': False})
+            if not form.validate():
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({"row": number, "errors": form.errors})
+                continue
+            row['owner_id'] = current_user.id
+            row.update(health_columns(row['password'], cipher.fingerprint_key))
+            row['password'] = cipher.encrypt(row['password'])
+            chunk.append(row)
+            imported += 1
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    except (ValueError, csv.Error) as e:
+        flush()
+        return jsonify({"message": f"Could not parse file: {e}", "imported": imported, "failed": failed, "errors": errors}), 400
+
+    return jsonify({"imported": imported, "failed": failed, "errors": errors}), 200
+
+# Streams the current user's entries as ?format=csv (default) or ?format=json
+@main.route('/manager/export')
+@login_required
+def export_passwords():
+    fmt = request.args.get('format', 'csv')
+    cipher = vault_cipher()
+    rows = (db.session.query(PasswordManager.webaddress, PasswordManager.username, PasswordManager.email, PasswordManager.password)
+            .filter_by(owner_id=current_user.id)
+            .order_by(PasswordManager.sl)
+            .yield_per(1000))
+    # rows that do not decrypt are left out. They are counted before streaming, so the user can be told
+    # (flash, X-Export-Skipped) instead of getting a file cut off halfway; this costs one more decryption pass.
+    passwords = db.session.query(PasswordManager.password).filter_by(owner_id=current_user.id).yield_per(1000)
+    skipped = cipher.count_invalid(password for password, in passwords)
+    # one Cipher for the whole export, decrypting each batch of 1000 as it is streamed
+    rows = cipher.decrypt_rows(rows, skip_invalid=True)
+    if fmt == 'json':
+        body, mimetype = transfer.export_json(rows), 'application/json'
+    else:
+        fmt, body, mimetype = 'csv', transfer.export_csv(rows), 'text/csv'
+    headers = {'Content-Disposition': f'attachment; filename=passwords.{fmt}'}
+    if skipped:
+        current_app.logger.warning('export for user %s skipped %s entries that could not be decrypted', current_user.id, skipped)
+        flash(f'{skipped} saved passwords could not be decrypted and were left out of the export.', 'danger')
+        headers['X-Export-Skipped'] = str(skipped)
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+# The vault as JSON without the passwords (see reveal()), for the extension and other clients that keep a local copy.
+# Poll with If-None-Match for a 304 while nothing changed, and ?since=<version> for only the changes.
+@main.route('/api/vault')
+@login_required
+def api_vault():
+    version = vault.current_version(db.session, current_user.id)
+    # weak ETags: the body may go out gzip or brotli encoded (compression.py), and any encoding of a version will do
+    if request.if_none_match.contains_weak(vault.etag(current_user.id, version)):
+        response = Response(status=304)
+        response.set_etag(vault.etag(current_user.id, version), weak=True)
+    else:
+        result = vault.changes(db.session, current_user.id, version, since=request.args.get('since', type=int))
+        response = jsonify(result)
+        response.set_etag(vault.etag(current_user.id, result['version']), weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Decrypts one password, for the show-password toggle on display() and for API clients
+@main.route('/api/vault/<int:sl>/reveal', methods=['POST'])
+@login_required
+def reveal(sl):
+    cipher = vault_cipher()
+    value = db.session.query(PasswordManager.password).filter_by(sl=sl, owner_id=current_user.id).scalar()
+    if value is None:
+        abort(404)
+    try:
+        password = cipher.decrypt(value)
+    except InvalidTag:
+        return jsonify({"message": "This password could not be decrypted."}), 409
+    response = jsonify({"sl": sl, "password": password})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def health_report():
+    """ The vault health report of the current user, see health.build_report(). """
+    columns = (PasswordManager.sl, PasswordManager.webaddress, PasswordManager.username,
+               PasswordManager.strength, PasswordManager.fingerprint, PasswordManager.skeleton)
+    # rows saved before health scores existed get them computed once and stored
+    stale = db.session.query(PasswordManager).filter_by(owner_id=current_user.id).filter(PasswordManager.strength.is_(None)).all()
+    if stale:
+        cipher = vault_cipher()
+        for field in stale:
+            try:
+                password = cipher.decrypt(field.password)
+            except InvalidTag:
+                # stays unscored and out of the report below, it is retried next time
+                continue
+            for column, value in health_columns(password, cipher.fingerprint_key).items():
+                setattr(field, column, value)
+        db.session.commit()
+    rows = db.session.query(*columns).filter_by(owner_id=current_user.id).filter(PasswordManager.strength.isnot(None)).yield_per(1000)
+    report = build_report(rows)
+    # bulk re-check of the whole vault against the breached password corpus
+    corpus = get_corpus(current_app.config['BREACHED_PASSWORDS_PATH'])
+    if corpus is not None:
+        cipher = vault_cipher()
+        entries = db.session.query(PasswordManager.sl, PasswordManager.webaddress, PasswordManager.username, PasswordManager.password).filter_by(owner_id=current_user.id).all()
+        # each entry stays paired with its own password, entries that do not decrypt are left out
+        decrypted = list(cipher.decrypt_rows(((entry, entry.password) for entry in entries), skip_invalid=True))
+        counts = corpus.count_many([password for _, password in decrypted])
+        report['breached'] = [(entry, seen) for (entry, _), seen in zip(decrypted, counts) if seen]
+    return report
+
+# The summary shows counts and the first HEALTH_PREVIEW_SIZE entries of each section,
+# health_section() pages through the rest, so the page stays small for large vaults.
+@main.route('/manager/health')
+@login_required
+def health():
+    return render_template('health.html', title='Vault Health', report=health_report(), rating=rating,
+                           preview=current_app.config['HEALTH_PREVIEW_SIZE'])
 
-@app.route('/logout')
+@main.route('/manager/health/<section>')
+@login_required
+def health_section(section):
+    report = health_report()
+    if section not in HEALTH_SECTIONS or section not in report:
+        abort(404)
+    size = current_app.config['HEALTH_PAGE_SIZE']
+    page = max(1, request.args.get('page', 1, type=int))
+    entries = report[section]
+    if section in ('reused', 'similar'):
+        # page through the rows of all groups, so one very large group is split over pages too
+        entries = [(number, len(group), row) for number, group in enumerate(entries, start=1) for row in group]
+    return render_template('health_section.html', title='Vault Health', section=section, heading=HEALTH_SECTIONS[section],
+                           entries=entries[(page - 1) * size:page * size], total=len(entries), page=page,
+                           pages=max(1, -(-len(entries) // size)), rating=rating)
+
+@main.route('/logout')
 def logout():
+    encryption.forget_key()
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 def send_reset_email(user):
     token = user.get_reset_token()
-    msg = Message('Password Reset Request', sender=os.environ.get('MAIL_DEFAULT_SENDER'), recipients=[user.email])
-    msg.body = f'''To reset your password, visit the following link:
-{url_for('reset_token', token=token, _external=True)}
+    body = f'''To reset your password, visit the following link:
+{url_for('main.reset_token', token=token, _external=True)}
 
 If you did not make this request, simply ignore this email.
 '''
-    mail.send(msg)
+    outbox.enqueue('Password Reset Request', [user.email], body, sender=os.environ.get('MAIL_DEFAULT_SENDER'))
 
-@app.route('/reset_password', methods=['GET', 'POST'])
+@main.route('/reset_password', methods=['GET', 'POST'])
 def reset_request():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     form = RequestResetForm()
     if form.validate_on_submit():
+        throttle.check('reset', form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
         if user:
             send_reset_email(user)
             flash('An email has been sent with instructions to reset your password.', 'info')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         else:
             flash('No account found with that email address.', 'danger')
     return render_template('reset_request.html', title='Reset Password', form=form)
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])
+@main.route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_token(token):
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     user = User.verify_reset_token(token)
     if user is None:
         flash('That is an invalid or expired token', 'danger')
-        return redirect(url_for('reset_request'))
+        return redirect(url_for('main.reset_request'))
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hashing.generate_password_hash(form.password.data)
         user.password = hashed_password
+        recovered = encryption.reset(user, form.password.data)
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash("Your password has been updated. Now you can login.", 'success')
-        return redirect(url_for('login'))
+        if not recovered:
+            flash('Your saved passwords were locked with your old password and could not be recovered. '
+                  'They are still listed, save them again to use them.', 'danger')
+        return redirect(url_for('main.login'))
     return render_template('reset_token.html', title='Reset Password', form=form)
 
 
 # Endpoint to save the credentials
-@app.route('/save_password', methods=['POST'])
+@main.route('/save_password', methods=['POST'])
 def save_password():
-    data = request.json
-    web_url = data.get('web_url')
-    password = data.get('password')
+    data = request.get_json(silent=True)
+    web_url = data.get('web_url') if isinstance(data, dict) else None
+    password = data.get('password') if isinstance(data, dict) else None
     
-    if web_url and password:
-        # Connect to the database
-        conn = sqlite3.connect('ext.db')
-        cursor = conn.cursor()
-        
-        # Insert the new credentials into the table
-        cursor.execute("INSERT INTO credentials (web_url, password) VALUES (?, ?)", (web_url, password))
-        conn.commit()
-        conn.close()
+    if isinstance(web_url, str) and isinstance(password, str) and web_url and password:
+        # Merged with any other saves arriving at the same time into one transaction
+        get_writer().write([(web_url, encryption.ext_encrypt(password))])
 
         return jsonify({"message": "Password saved successfully!"}), 200
     
     return jsonify({"message": "Failed to save password, missing data."}), 400
 
-
-def save_picture(form_picture):
-    random_hex = urandom(8).hex()
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.root_path, 'static/profile_pics', picture_fn)
-    
-    output_size = (128, 128)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
-
-    return picture_fn
-
-@app.route('/manager/account', methods=['GET', 'POST'])
+# Endpoint to save many credentials at once, e.g. [{"web_url": ..., "password": ...}, ...]
+@main.route('/save_passwords', methods=['POST'])
+def save_passwords():
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not data:
+        return jsonify({"message": "Expected a non-empty JSON array."}), 400
+
+    rows = []
+    for index, item in enumerate(data):
+        web_url = item.get('web_url') if isinstance(item, dict) else None
+        password = item.get('password') if isinstance(item, dict) else None
+        if not (isinstance(web_url, str) and isinstance(password, str) and web_url and password):
+            return jsonify({"message": f"Failed to save passwords, missing data in item {index}."}), 400
+        rows.append((web_url, password))
+
+    get_writer().write([(web_url, encryption.ext_encrypt(password)) for web_url, password in rows])
+    return jsonify({"message": f"{len(rows)} passwords saved successfully!", "count": len(rows)}), 200
+
+
+def avatar_url(image_file, size=128):
+    if image_file == pictures.DEFAULT_PICTURE:
+        return url_for('static', filename='profile_pics/' + image_file)
+    return url_for('main.avatar', size=size, image_file=image_file)
+
+@main.route('/avatar/<int:size>/<image_file>')
+def avatar(size, image_file):
+    if size not in current_app.config['AVATAR_SIZES']:
+        abort(404)
+    directory = pictures.picture_dir()
+    filename = pictures.rendition_name(image_file, size)
+    if not os.path.exists(os.path.join(directory, filename)):
+        if not pictures.wait_for_renditions(image_file):
+            # still being resized, most likely by another worker process
+            return send_from_directory(directory, pictures.DEFAULT_PICTURE, max_age=0)
+        if not os.path.exists(os.path.join(directory, filename)):
+            # pictures uploaded before renditions existed are only stored under their own name
+            filename = image_file
+        if not os.path.exists(os.path.join(directory, filename)):
+            # the upload could not be resized and was dropped; not immutable, the user may upload another
+            return send_from_directory(directory, pictures.DEFAULT_PICTURE, max_age=0)
+    response = send_from_directory(directory, filename, max_age=current_app.config['AVATAR_MAX_AGE'])
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['AVATAR_MAX_AGE']}, immutable"
+    return response
+
+def picture_in_use(image_file):
+    return db.session.query(User.id).filter_by(image_file=image_file).first() is not None
+
+@main.route('/manager/account', methods=['GET', 'POST'])
 @login_required
 def account():
     form = UserAccountUpdate()
     if form.validate_on_submit():
+        old_picture = current_user.image_file
         if form.picture.data:
-            picture_file = save_picture(form.picture.data)
+            picture_file = pictures.save_picture(form.picture.data)
             current_user.image_file = picture_file
         current_user.name = form.name.data
         current_user.email = form.email.data
         db.session.commit()
+        user_cache.invalidate(current_user.id)
+        if old_picture != current_user.image_file:
+            pictures.collect_garbage(old_picture, picture_in_use)
         flash('Your account has been updated.', 'success')
-        return redirect(url_for('account'))
+        return redirect(url_for('main.account'))
     elif request.method == 'GET':
         form.name.data = current_user.name
         form.email.data = current_user.email
-    image_file = url_for('static', filename='profile_pics/' + current_user.image_file)
+    image_file = avatar_url(current_user.image_file)
     return render_template('account.html', image_file=image_file, form=form)
 
-@app.route('/delete/<int:sl>')
+@main.route('/delete/<int:sl>')
 @login_required
 def delete(sl):
-    field = db.session.query(PasswordManager).filter_by(sl=sl).first()
+    field = db.session.query(PasswordManager).filter_by(sl=sl, owner_id=current_user.id).first_or_404()
     db.session.delete(field)
     db.session.commit()
-    return redirect(url_for('display'))
+    return redirect(url_for('main.display'))
 
-@app.route('/update/<int:sl>', methods=['GET', 'POST'])
+@main.route('/update/<int:sl>', methods=['GET', 'POST'])
 @login_required
 def update(sl):
     form = UpdatePassword()
-    values = db.session.query(PasswordManager).filter_by(sl=sl).first()
+    cipher = vault_cipher()
+    values = db.session.query(PasswordManager).filter_by(sl=sl, owner_id=current_user.id).first_or_404()
+    try:
+        current = cipher.decrypt(values.password)
+    except InvalidTag:
+        flash('This password could not be decrypted, so it cannot be edited.', 'danger')
+        return redirect(url_for('main.display'))
     if form.validate_on_submit():
         values.webaddress = form.webaddress.data
         values.username = form.username.data
         values.email = form.email.data
-        values.password = form.password.data
+        if form.password.data != current:
+            values.set_password(form.password.data, cipher)
         db.session.commit()
-        return redirect(url_for('display'))
+        return redirect(url_for('main.display'))
     elif request.method == 'GET':
         form.webaddress.data = values.webaddress
         form.username.data = values.username
         form.email.data = values.email
-        form.password.data = values.password
+        form.password.data = current
     return render_template('update.html', title='Update', form=form)
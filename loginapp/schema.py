@@ -0,0 +1,51 @@
+"""
+Brings an existing test.db up to date with the models.
+
+db.create_all() only creates missing tables, so columns and indexes added to
+existing models later are added here. New columns must be nullable.
+
+    python -m loginapp.schema    # bootstrap() for the default config
+"""
+from sqlalchemy import inspect, text
+from loginapp import db
+from loginapp.search import init_search_index
+
+
+def add_missing_columns(engine):
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+
+def add_missing_indexes(engine):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def upgrade_schema():
+    engine = db.engine
+    db.create_all()
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    init_search_index(engine)
+
+
+def bootstrap(app):
+    """ Prepare both databases for `app`. Run once before serving, not on every create_app(). """
+    from loginapp import encryption, extdb
+    with app.app_context():
+        upgrade_schema()
+        extdb.init_db(app.config['EXT_DB_PATH'])
+        if encryption.ext_cipher() is not None:
+            extdb.encrypt_plaintext(app.config['EXT_DB_PATH'], encryption.ext_cipher())
+
+
+if __name__ == '__main__':
+    from loginapp import create_app
+    bootstrap(create_app())
@@ -0,0 +1,120 @@
+"""
+Search over a user's vault entries.
+
+password_search is an SQLite FTS5 table using the trigram tokenizer, with
+password_manager as its external content. Triggers on password_manager keep it
+in sync, so add(), update(), delete() and any bulk insert update the index in
+the same transaction as the row itself.
+"""
+from sqlalchemy import text
+
+# The owner is indexed as a token like "<42>" in the owner column, so MATCH itself only finds one user's
+# rows instead of every user's matches being fetched and filtered afterwards. password_manager has no such
+# column, so the external content is a view adding it.
+SEARCH_SCHEMA = [
+    '''CREATE VIEW IF NOT EXISTS password_search_content AS
+        SELECT sl, webaddress, username, email, '<' || owner_id || '>' AS owner FROM password_manager''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS password_search USING fts5(
+        webaddress, username, email, owner,
+        content='password_search_content', content_rowid='sl', tokenize='trigram'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS password_search_ai AFTER INSERT ON password_manager BEGIN
+        INSERT INTO password_search(rowid, webaddress, username, email, owner)
+        VALUES (new.sl, new.webaddress, new.username, new.email, '<' || new.owner_id || '>');
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS password_search_ad AFTER DELETE ON password_manager BEGIN
+        INSERT INTO password_search(password_search, rowid, webaddress, username, email, owner)
+        VALUES ('delete', old.sl, old.webaddress, old.username, old.email, '<' || old.owner_id || '>');
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS password_search_au AFTER UPDATE OF webaddress, username, email, owner_id ON password_manager BEGIN
+        INSERT INTO password_search(password_search, rowid, webaddress, username, email, owner)
+        VALUES ('delete', old.sl, old.webaddress, old.username, old.email, '<' || old.owner_id || '>');
+        INSERT INTO password_search(rowid, webaddress, username, email, owner)
+        VALUES (new.sl, new.webaddress, new.username, new.email, '<' || new.owner_id || '>');
+    END''',
+]
+
+# the first version kept owner_id UNINDEXED; its table and triggers are replaced
+OLD_SEARCH_SCHEMA = ['DROP TRIGGER IF EXISTS password_search_ai', 'DROP TRIGGER IF EXISTS password_search_ad',
+                     'DROP TRIGGER IF EXISTS password_search_au', 'DROP TABLE IF EXISTS password_search']
+
+# trigrams need at least three characters, shorter queries fall back to LIKE
+MIN_MATCH_LENGTH = 3
+
+
+def init_search_index(engine):
+    """ Create the FTS table and triggers, and index existing rows the first time. """
+    with engine.begin() as conn:
+        table = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'password_search'")).scalar()
+        if table is not None and 'UNINDEXED' in table:
+            for statement in OLD_SEARCH_SCHEMA:
+                conn.execute(text(statement))
+            table = None
+        exists = table is not None
+        for statement in SEARCH_SCHEMA:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO password_search(password_search) VALUES ('rebuild')"))
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _owner_match(owner_id, query):
+    """ `query` limited to one owner's rows inside the full-text index. """
+    return f'owner : "<{int(owner_id)}>" AND {{webaddress username email}} : ({query})'
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _trigrams(term):
+    term = term.lower()
+    return sorted({term[i:i + 3] for i in range(len(term) - 2)})
+
+
+def prefix_search(session, owner_id, term, limit=10):
+    """
+    Autocomplete: entries where any field contains `term`, those starting with it first.
+    """
+    like = _escape_like(term) + '%'
+    if len(term) < MIN_MATCH_LENGTH:
+        # too short for the trigram index, scan this owner's rows through ix_password_manager_owner_sl
+        sql = '''
+            SELECT sl, webaddress, username, email FROM password_manager
+            WHERE owner_id = :owner_id
+              AND (webaddress LIKE :contains ESCAPE '\\' OR username LIKE :contains ESCAPE '\\' OR email LIKE :contains ESCAPE '\\')
+            ORDER BY (webaddress LIKE :like ESCAPE '\\' OR username LIKE :like ESCAPE '\\' OR email LIKE :like ESCAPE '\\') DESC,
+                     length(webaddress), sl
+            LIMIT :limit
+        '''
+        params = {'owner_id': owner_id, 'contains': '%' + like, 'like': like, 'limit': limit}
+    else:
+        sql = '''
+            SELECT rowid AS sl, webaddress, username, email FROM password_search
+            WHERE password_search MATCH :match
+            ORDER BY (webaddress LIKE :like ESCAPE '\\' OR username LIKE :like ESCAPE '\\' OR email LIKE :like ESCAPE '\\') DESC,
+                     length(webaddress), rank
+            LIMIT :limit
+        '''
+        params = {'match': _owner_match(owner_id, _quote(term)), 'like': like, 'limit': limit}
+    return [dict(row._mapping) for row in session.execute(text(sql), params)]
+
+
+def fuzzy_search(session, owner_id, term, limit=20):
+    """
+    Typo tolerant search: any entry sharing a trigram with `term`, ranked by bm25,
+    so entries sharing more (and rarer) trigrams come first.
+    """
+    trigrams = _trigrams(term)
+    if not trigrams:
+        return prefix_search(session, owner_id, term, limit)
+    sql = '''
+        SELECT rowid AS sl, webaddress, username, email, rank FROM (
+            -- the owner column weighs nothing, every candidate has the same owner token
+            SELECT rowid, webaddress, username, email, bm25(password_search, 1.0, 1.0, 1.0, 0.0) AS rank FROM password_search
+            WHERE password_search MATCH :match
+        )
+        ORDER BY rank LIMIT :limit
+    '''
+    params = {'match': _owner_match(owner_id, ' OR '.join(_quote(t) for t in trigrams)), 'limit': limit}
+    return [dict(row._mapping) for row in session.execute(text(sql), params)]
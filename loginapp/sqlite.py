@@ -0,0 +1,32 @@
+"""
+Connection settings for our SQLite files, test.db through SQLAlchemy and
+ext.db through sqlite3, both taken from the SQLITE_* config values.
+
+- journal_mode=WAL: readers no longer block the writer and the other way round.
+- busy_timeout: a writer waits for the lock instead of failing at once with
+  "database is locked" when add() and update() run at the same time.
+- synchronous: NORMAL is safe with WAL and only syncs at checkpoints.
+"""
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from loginapp.config import Config
+
+
+def _settings():
+    return current_app.config if has_app_context() else vars(Config)
+
+def configure_connection(conn):
+    """ Apply the SQLITE_* settings to a DB-API sqlite3 connection. """
+    settings = _settings()
+    conn.execute(f"PRAGMA busy_timeout={int(settings['SQLITE_BUSY_TIMEOUT'])}")
+    conn.execute(f"PRAGMA journal_mode={settings['SQLITE_JOURNAL_MODE']}")
+    conn.execute(f"PRAGMA synchronous={settings['SQLITE_SYNCHRONOUS']}")
+    return conn
+
+
+@event.listens_for(Engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    # the SQLAlchemy side: every new pooled connection to an SQLite database
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        configure_connection(dbapi_connection)
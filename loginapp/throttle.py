@@ -0,0 +1,167 @@
+"""
+Token bucket throttling for /login and /reset_password.
+
+Each limit in THROTTLE_LIMITS is a bucket per key (an account email or a
+client IP) holding up to `burst` tokens, refilled at `rate` tokens per second.
+An attempt takes one token; with none left it is rejected with a 429 before
+the password is hashed, so a credential stuffing run cannot keep the bcrypt
+pool busy.
+
+A bucket that has refilled completely is the same as no bucket at all, so
+idle buckets are dropped by a periodic sweep and memory only holds keys seen
+recently.
+
+Backends (THROTTLE_BACKEND):
+- 'memory': buckets in this process, split over THROTTLE_SHARDS dicts with a
+  lock each, so concurrent requests rarely wait on one another. With several
+  worker processes each one counts separately.
+- 'sqlite': buckets in THROTTLE_SQLITE_PATH, shared by every process on the
+  host. One UPSERT per attempt.
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+from loginapp.metrics import throttled_requests
+
+
+class Throttled(Exception):
+    """ Raised when a bucket is empty. Turned into a 429 by the error handler below. """
+    def __init__(self, limit, retry_after):
+        super().__init__(limit, retry_after)
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class _Shard:
+    def __init__(self):
+        self.buckets = OrderedDict() # key -> [tokens, monotonic time of the last update], least recently used first
+        self.lock = threading.Lock()
+        self.next_sweep = 0.0
+
+
+class MemoryLimiter:
+    def __init__(self, burst, rate, shards=64, max_keys=100000):
+        self.burst = burst
+        self.rate = rate
+        self.shards = [_Shard() for _ in range(shards)]
+        self.max_keys = max(1, max_keys // shards) # per shard
+        # after this long untouched a bucket is full again
+        self.idle = burst / rate
+
+    def allow(self, key):
+        """ Take a token for `key`. Returns 0 when allowed, else the seconds until one is available. """
+        now = time.monotonic()
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            if now >= shard.next_sweep or len(shard.buckets) >= self.max_keys:
+                self._sweep(shard, now)
+            bucket = shard.buckets.get(key)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            shard.buckets[key] = [tokens - 1 if tokens >= 1 else tokens, now]
+            shard.buckets.move_to_end(key)
+            if tokens >= 1:
+                return 0
+            return (1 - tokens) / self.rate
+
+    def _sweep(self, shard, now):
+        buckets = shard.buckets
+        for key in [key for key, (tokens, stamp) in buckets.items() if tokens + (now - stamp) * self.rate >= self.burst]:
+            del buckets[key]
+        if len(buckets) >= self.max_keys:
+            # still too many live buckets: forget the least recently used quarter rather than grow without bound.
+            # A client that keeps trying stays at the recent end, so fresh keys cannot push its bucket out.
+            while len(buckets) > self.max_keys * 3 // 4:
+                buckets.popitem(last=False)
+        shard.next_sweep = now + self.idle
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self.shards)
+
+
+# tokens are only spent when the refilled amount covers one, otherwise the row is left as it was
+SQLITE_TAKE = '''
+    INSERT INTO throttle_bucket (name, key, tokens, updated) VALUES (:name, :key, :burst - 1, :now)
+    ON CONFLICT (name, key) DO UPDATE SET tokens = min(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now
+    WHERE min(:burst, tokens + (:now - updated) * :rate) >= 1
+'''
+
+class SQLiteLimiter:
+    def __init__(self, path, name, burst, rate):
+        self.path = path
+        self.name = name
+        self.burst = burst
+        self.rate = rate
+        self.idle = burst / rate
+        self.next_sweep = 0.0
+        self.local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS throttle_bucket (
+            name TEXT NOT NULL, key TEXT NOT NULL, tokens REAL NOT NULL, updated REAL NOT NULL,
+            PRIMARY KEY (name, key)) WITHOUT ROWID''')
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # autocommit: each statement is its own transaction
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # losing the last few attempts in a power cut is fine, a sync per login is not
+            conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def allow(self, key):
+        now = time.time() # wall clock, shared with the other processes
+        conn = self._connect()
+        if now >= self.next_sweep:
+            self.next_sweep = now + self.idle
+            conn.execute('DELETE FROM throttle_bucket WHERE name = ? AND tokens + (? - updated) * ? >= ?',
+                         (self.name, now, self.rate, self.burst))
+        params = {'name': self.name, 'key': key, 'burst': self.burst, 'rate': self.rate, 'now': now}
+        if conn.execute(SQLITE_TAKE, params).rowcount:
+            return 0
+        row = conn.execute('SELECT tokens, updated FROM throttle_bucket WHERE name = ? AND key = ?', (self.name, key)).fetchone()
+        tokens = min(self.burst, row[0] + (now - row[1]) * self.rate) if row else self.burst
+        return max(0, (1 - tokens) / self.rate)
+
+    def __len__(self):
+        return self._connect().execute('SELECT count(*) FROM throttle_bucket WHERE name = ?', (self.name,)).fetchone()[0]
+
+
+def get_limiter(name):
+    """ The app's limiter for one entry of THROTTLE_LIMITS, created on first use. """
+    limiters = current_app.extensions.setdefault('throttle', {})
+    limiter = limiters.get(name)
+    if limiter is None:
+        config = current_app.config
+        burst, rate = config['THROTTLE_LIMITS'][name]
+        if config['THROTTLE_BACKEND'] == 'sqlite':
+            limiter = SQLiteLimiter(config['THROTTLE_SQLITE_PATH'], name, burst, rate)
+        else:
+            limiter = MemoryLimiter(burst, rate, shards=config['THROTTLE_SHARDS'], max_keys=config['THROTTLE_MAX_KEYS'])
+        limiter = limiters.setdefault(name, limiter)
+    return limiter
+
+
+def check(prefix, account):
+    """
+    Take a token from the client IP's bucket, then the account's, for `prefix` ('login' or 'reset').
+    Raises Throttled when either is empty. Call it before any password hashing.
+    """
+    if not current_app.config['THROTTLE_ENABLED']:
+        return
+    for name, key in ((prefix + '_ip', request.remote_addr or ''), (prefix + '_account', (account or '').strip().lower())):
+        retry_after = get_limiter(name).allow(key)
+        if retry_after:
+            throttled_requests.inc(name)
+            raise Throttled(name, retry_after)
+
+
+def too_many_attempts(error):
+    retry_after = max(1, math.ceil(error.retry_after))
+    return f"Too many attempts. Please try again in {retry_after} seconds.", 429, {'Retry-After': str(retry_after)}
+
+def init_app(app):
+    app.register_error_handler(Throttled, too_many_attempts)
@@ -0,0 +1,95 @@
+"""
+Streaming import and export of vault entries as CSV or JSON.
+
+Imports read the upload incrementally, so memory does not grow with the file.
+Column names from common browser exports (Chrome, Firefox, Bitwarden) are
+mapped onto our own fields.
+"""
+import csv
+import io
+import json
+
+FIELDS = ['webaddress', 'username', 'email', 'password']
+
+# our field -> accepted column names, first match wins
+ALIASES = {
+    'webaddress': ['webaddress', 'url', 'web_url', 'login_uri', 'origin', 'website'],
+    'username': ['username', 'login_username', 'user'],
+    'email': ['email', 'e-mail'],
+    'password': ['password', 'login_password'],
+}
+
+
+def normalise(record):
+    """ Map a parsed record onto webaddress/username/email/password. """
+    lowered = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+    row = {}
+    for field, names in ALIASES.items():
+        row[field] = next((str(lowered[name]).strip() for name in names if lowered.get(name)), '')
+    # browser exports have no email column, but the username often is one
+    if not row['email'] and '@' in row['username']:
+        row['email'] = row['username']
+    return row
+
+
+def iter_csv(stream):
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(reader)
+
+
+def iter_json(stream, chunk_size=64 * 1024):
+    """
+    Yield objects from a JSON array (or from JSON lines) without loading the whole file.
+    """
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[')
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buffer = buffer[end:]
+                continue
+        if eof:
+            return
+        chunk = reader.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_records(stream, filename):
+    if filename.lower().endswith(('.json', '.jsonl')):
+        return iter_json(stream)
+    return iter_csv(stream)
+
+
+def export_csv(rows):
+    """ Yield CSV text for (webaddress, username, email, password) rows, one line at a time. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_json(rows):
+    """ Yield a JSON array of entries, one element at a time. """
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(FIELDS, row)))
+        separator = ',\n'
+    yield '\n]\n'
@@ -0,0 +1,61 @@
+"""
+Versioned JSON view of a user's vault for /api/vault.
+
+Every change to a user's PasswordManager rows bumps user.vault_version and
+stamps the rows with it (models.stamp_vault_changes), and deletions leave a
+PasswordTombstone. A client keeps the last version it saw:
+
+- the ETag is derived from the version, so polling with If-None-Match
+  costs one primary key lookup and a 304 while nothing changed;
+- ?since=<version> returns only the rows changed after that version and
+  the sl of rows deleted after it.
+
+Passwords are not part of the feed: they are stored encrypted and only
+decrypted one at a time by /api/vault/<sl>/reveal.
+"""
+from loginapp.models import User, PasswordManager, PasswordTombstone
+
+ENTRY_COLUMNS = (PasswordManager.sl, PasswordManager.webaddress, PasswordManager.username,
+                 PasswordManager.email, PasswordManager.version, PasswordManager.updated_at)
+
+
+def current_version(session, owner_id):
+    version = session.query(User.vault_version).filter(User.id == owner_id).scalar()
+    return version or 0
+
+def etag(owner_id, version):
+    return f'vault-{owner_id}-{version}'
+
+
+def _entry(row):
+    return {
+        'sl': row.sl,
+        'webaddress': row.webaddress,
+        'username': row.username,
+        'email': row.email,
+        'version': row.version or 0,
+        'updated_at': row.updated_at.isoformat() + 'Z' if row.updated_at else None,
+    }
+
+
+def changes(session, owner_id, version, since=None):
+    """
+    The whole vault, or with `since` only what changed after that version.
+    A `since` newer than `version` (e.g. the database was restored) gets the whole vault, marked "full".
+    """
+    full = not since or since > version
+    query = session.query(*ENTRY_COLUMNS).filter(PasswordManager.owner_id == owner_id)
+    if not full:
+        query = query.filter(PasswordManager.version > since)
+    entries = [_entry(row) for row in query.order_by(PasswordManager.sl).yield_per(1000)]
+    # rows written between reading the version and the rows are included, so report their version;
+    # the client then sees them again on the next poll at worst, never misses them
+    version = max([version] + [entry['version'] for entry in entries])
+    result = {'version': version, 'full': full, 'entries': entries}
+    if not full:
+        # SQLite may give a new row the sl of a deleted one, the live row wins
+        present = {entry['sl'] for entry in entries}
+        tombstones = session.query(PasswordTombstone.sl).filter(PasswordTombstone.owner_id == owner_id,
+                                                                 PasswordTombstone.version > since)
+        result['deleted'] = [sl for (sl,) in tombstones if sl not in present]
+    return result
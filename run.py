@@ -1,6 +1,12 @@
-from loginapp import app, db
+from loginapp import create_app
+from loginapp.outbox import outbox
+from loginapp.schema import bootstrap
+
+app = create_app()
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-        app.run(debug=True, port=8000)
+    # creates missing tables, columns, indexes, the search index and ext.db
+    bootstrap(app)
+    # deliver any email left in the outbox by a previous run
+    outbox.start(app)
+    app.run(debug=True, port=8000)
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from loginapp import create_app
+from loginapp.schema import bootstrap
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """ An app on throwaway databases in tmp_path, fast hashing, no CSRF or throttle. Keyword arguments override the config. """
+    def make(**config):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp_path, 'test.db'),
+            'EXT_DB_PATH': os.path.join(tmp_path, 'ext.db'),
+            'JINJA_BYTECODE_CACHE_DIR': '',
+            'WTF_CSRF_ENABLED': False,
+            'THROTTLE_ENABLED': False,
+            'HASH_POOL_SIZE': 0,
+            'BCRYPT_LOG_ROUNDS': 4,
+            'VAULT_KDF_N': 2 ** 10,
+            **config,
+        })
+        bootstrap(app)
+        return app
+    return make
@@ -0,0 +1,137 @@
+"""
+Mail outbox against a local aiosmtpd server: delivery, backoff, giving up and leases.
+
+    pip install aiosmtpd
+    python -m pytest tests/test_outbox.py
+"""
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from loginapp import db
+from loginapp.models import OutboxMessage
+from loginapp.outbox import Outbox
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Handler:
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp():
+    handler = Handler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def app(make_app, smtp):
+    return make_app(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp.port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                    MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_OUTBOX_BACKOFF=30, MAIL_OUTBOX_MAX_ATTEMPTS=3)
+
+
+def add_message(**values):
+    message = OutboxMessage(subject='Hello', sender='app@example.com', recipients='user@example.com', body='Hi', **values)
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+
+def smtp_down(app):
+    """ Point the outbox at a port nobody listens on. """
+    app.config['MAIL_PORT'] = free_port()
+    app.extensions.pop('mail', None)
+
+def smtp_up(app, smtp):
+    app.config['MAIL_PORT'] = smtp.port
+    app.extensions.pop('mail', None)
+
+def make_due(message_id):
+    db.session.get(OutboxMessage, message_id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_enqueued_message_is_sent_in_the_background(app, smtp):
+    outbox = Outbox()
+    with app.app_context():
+        message_id = outbox.enqueue('Welcome', ['new@example.com'], 'Thanks for registering', sender='app@example.com').id
+        deadline = time.monotonic() + 5
+        while not smtp.handler.envelopes and time.monotonic() < deadline:
+            time.sleep(0.05)
+        outbox.stop()
+        assert [envelope.rcpt_tos for envelope in smtp.handler.envelopes] == [['new@example.com']]
+        db.session.expire_all()
+        message = db.session.get(OutboxMessage, message_id)
+        assert message.sent_at is not None and message.lease_until is None
+        assert outbox.depth() == 0
+
+
+def test_failed_send_backs_off_then_succeeds(app, smtp):
+    outbox = Outbox()
+    with app.app_context():
+        message_id = add_message()
+        smtp_down(app)
+        assert outbox.flush() == 0
+        db.session.expire_all()
+        message = db.session.get(OutboxMessage, message_id)
+        assert message.attempts == 1 and message.last_error and message.lease_until is None
+        assert message.next_attempt_at > datetime.utcnow() + timedelta(seconds=25)
+
+        # not due yet: nothing is tried even with the server back
+        smtp_up(app, smtp)
+        assert outbox.flush() == 0
+        assert smtp.handler.envelopes == []
+
+        make_due(message_id)
+        assert outbox.flush() == 1
+        assert len(smtp.handler.envelopes) == 1
+
+
+def test_backoff_doubles_and_gives_up(app, smtp):
+    outbox = Outbox()
+    with app.app_context():
+        message_id = add_message()
+        smtp_down(app)
+        delays = []
+        for _ in range(app.config['MAIL_OUTBOX_MAX_ATTEMPTS']):
+            before = datetime.utcnow()
+            outbox.flush()
+            db.session.expire_all()
+            message = db.session.get(OutboxMessage, message_id)
+            if not message.failed:
+                delays.append((message.next_attempt_at - before).total_seconds())
+                make_due(message_id)
+        assert message.failed and message.attempts == app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+        assert delays[0] == pytest.approx(30, abs=2) and delays[1] == pytest.approx(60, abs=2)
+        assert outbox.depth() == 0
+
+
+def test_leased_message_is_left_alone_until_the_lease_expires(app, smtp):
+    outbox = Outbox()
+    with app.app_context():
+        message_id = add_message(lease_until=datetime.utcnow() + timedelta(minutes=1))
+        assert outbox.flush() == 0
+        assert smtp.handler.envelopes == []
+
+        # the sender holding it died: once the lease runs out another sender picks it up
+        db.session.get(OutboxMessage, message_id).lease_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert outbox.flush() == 1
+        assert len(smtp.handler.envelopes) == 1
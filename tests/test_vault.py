@@ -0,0 +1,108 @@
+"""
+Vault encryption round trip through the Flask test client.
+
+    python -m pytest tests
+"""
+import pytest
+
+from loginapp import db, hashing
+from loginapp.models import User, PasswordManager
+
+EMAIL = 'owner@gmail.com'
+PASSWORD = 'Login#1234'
+
+
+def add_owner(app):
+    with app.app_context():
+        db.session.add(User(name='owner', email=EMAIL, password=hashing.generate_password_hash(PASSWORD)))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def app(make_app):
+    return add_owner(make_app())
+
+
+def login(client):
+    response = client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+    assert response.status_code == 302
+
+
+def test_saved_password_survives_a_new_login(app):
+    client = app.test_client()
+    login(client)
+    response = client.post('/manager/add', data={'webaddress': 'https://example.org', 'username': 'owner',
+                                                 'email': EMAIL, 'password': 'Site#5678pw'})
+    assert response.status_code == 302
+    client.get('/logout')
+
+    login(client)
+    with app.app_context():
+        sl = db.session.query(PasswordManager.sl).filter_by(webaddress='https://example.org').scalar()
+    response = client.post(f'/api/vault/{sl}/reveal')
+    assert response.status_code == 200
+    assert response.get_json()['password'] == 'Site#5678pw'
+
+
+def test_login_keeps_the_vault_key(app):
+    client = app.test_client()
+    login(client)
+    with app.app_context():
+        first = User.query.filter_by(email=EMAIL).one().vault_key
+    client.get('/logout')
+    login(client)
+    with app.app_context():
+        assert User.query.filter_by(email=EMAIL).one().vault_key == first
+    assert first
+
+
+def add_entry(client, webaddress, password):
+    response = client.post('/manager/add', data={'webaddress': webaddress, 'username': 'owner',
+                                                 'email': EMAIL, 'password': password})
+    assert response.status_code == 302
+    with client.application.app_context():
+        return db.session.query(PasswordManager.sl).filter_by(webaddress=webaddress).scalar()
+
+
+def reset_password(app, new_password):
+    with app.app_context():
+        token = User.query.filter_by(email=EMAIL).one().get_reset_token()
+    response = app.test_client().post(f'/reset_password/{token}', data={'password': new_password, 'confirm_password': new_password})
+    assert response.status_code == 302
+
+
+def test_reset_with_recovery_copy_keeps_saved_passwords(make_app):
+    app = add_owner(make_app(VAULT_SERVER_KEY='server-secret'))
+    client = app.test_client()
+    login(client)
+    sl = add_entry(client, 'https://example.org', 'Site#5678pw')
+    client.get('/logout')
+
+    reset_password(app, 'Reset#9012pw')
+    response = client.post('/login', data={'email': EMAIL, 'password': 'Reset#9012pw'})
+    assert response.status_code == 302
+    assert client.post(f'/api/vault/{sl}/reveal').get_json()['password'] == 'Site#5678pw'
+
+
+def test_reset_without_recovery_copy_still_logs_in(make_app):
+    app = add_owner(make_app(VAULT_SERVER_KEY=None))
+    client = app.test_client()
+    login(client)
+    old_sl = add_entry(client, 'https://example.org', 'Site#5678pw')
+    client.get('/logout')
+
+    reset_password(app, 'Reset#9012pw')
+    response = client.post('/login', data={'email': EMAIL, 'password': 'Reset#9012pw'})
+    assert response.status_code == 302 and response.location.endswith('/manager')
+    # the old entry is still listed but lost; new ones work
+    assert client.post(f'/api/vault/{old_sl}/reveal').status_code == 409
+    new_sl = add_entry(client, 'https://example.net', 'Site#3456pw')
+    assert client.post(f'/api/vault/{new_sl}/reveal').get_json()['password'] == 'Site#3456pw'
+
+
+def test_sqlite_key_store_needs_a_server_key(make_app, tmp_path):
+    from loginapp.cache import SQLiteTTLCache, TTLCache
+    path = str(tmp_path / 'vault_keys.db')
+    assert isinstance(make_app(VAULT_KEY_STORE='sqlite', VAULT_KEY_STORE_PATH=path, VAULT_SERVER_KEY=None).extensions['vault_keys'], TTLCache)
+    assert isinstance(make_app(VAULT_KEY_STORE='sqlite', VAULT_KEY_STORE_PATH=path, VAULT_SERVER_KEY='server-secret').extensions['vault_keys'], SQLiteTTLCache)
@@ -0,0 +1,4 @@
+# Entry point for WSGI servers, e.g. `gunicorn -c gunicorn.conf.py` (see there) or `gunicorn wsgi:app`
+from loginapp import create_app
+
+app = create_app()